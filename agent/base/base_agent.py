@@ -1,32 +1,121 @@
 import json
-from typing import Dict
-from llm.base.llmclient import BaseLLMClient
-from llm.base.llmclient import ChatClient
+from typing import AsyncIterator, Callable, Dict, Iterator, Tuple, Type
+from pydantic import BaseModel, ValidationError
+from util.json_repair import parse_json
+from llm.base.llmclient import AsyncLLMClient, DEFAULT_KEEP_ALIVE
+from llm.base.llmclient import ChatClient, AsyncChatClient
+from llm.base.models import model_config
+from util.metrics import metrics
 
 class BaseAgent:
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False, system_prompt_func=None):
-        """Initialize Agent with a base url and model name."""
-        self.llamaclient = BaseLLMClient(base_url=base_url, model=model, temperature=temperature, stream=stream, system_prompt_func=system_prompt_func)
+    # Pydantic model of the JSON the agent expects back, sent to the backend as a structured output schema
+    response_model: Type[BaseModel] = None
+    # Max estimated prompt tokens per request, longer conversations are trimmed before they are sent
+    token_budget: int = 8192
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, system_prompt_func=None, cache=None, token_budget=None, keep_alive=DEFAULT_KEEP_ALIVE, adapter="ollama"):
+        """
+        Initialize Agent with a base url and model name.
+        Without a `model`, each step runs on the model models.json sets for it, see llm.base.models.
+        `base_url` may also list several backends serving the same model (a list or comma separated),
+        requests are then balanced over them, see llm.base.balancer.
+        Pass a llm.base.cache.ResponseCache as `cache` to reuse responses to identical requests.
+        `token_budget` overrides the class default max prompt tokens (0 turns trimming off).
+        `keep_alive` is how long the backend should keep the model loaded after each request.
+        `adapter` is the backend's API: "ollama", "openai" or "llama.cpp", see llm.base.adapters.
+        """
+        response_format = self.response_model.model_json_schema() if self.response_model else None
+        budget = self.token_budget if token_budget is None else token_budget
+        self.model = model  # Explicit model for every step, overrides the model config
+        self.llamaclient = AsyncLLMClient(base_url=base_url, model=self.model_for(), temperature=temperature, stream=stream, system_prompt_func=system_prompt_func, cache=cache, response_format=response_format, token_budget=budget, name=type(self).__name__, keep_alive=keep_alive, adapter=adapter)
         self.client = ChatClient(self.llamaclient)
+        self.async_client = AsyncChatClient(self.llamaclient)
+
+    def model_for(self, step: str = None) -> str:
+        """The model a step of this agent runs on."""
+        return self.model or model_config().model_for(type(self).__name__, step)
+
+    def warm_up(self) -> float:
+        """Load the agent's models and prefill its system prompt on the backend, call it at startup."""
+        models = [self.model] if self.model else model_config().models_for(type(self).__name__)
+        elapsed = sum(self.llamaclient.warm_up(model=model) for model in models)
+        print(f"{type(self).__name__} : warmed up {', '.join(models)} in {elapsed:.2f} seconds")
+        return elapsed
+
+    def call_llm(self, messages: str | list[Dict[str, str]], on_token: Callable[[str], None] = None, step: str = None) -> Dict:
+        """Use LLM to generate a response, optionally streaming partial content to `on_token`."""
+
+        messages = self._to_messages(messages)
+
+        # Chat with the API
+        json_response = self.client.chat(messages, on_token=on_token, model=self._count_call(step))
+
+        return self._parse_response(json_response)
+
+    async def acall_llm(self, messages: str | list[Dict[str, str]], on_token: Callable[[str], None] = None, step: str = None) -> Dict:
+        """Use LLM to generate a response without blocking the event loop."""
+
+        messages = self._to_messages(messages)
+
+        # Chat with the API
+        json_response = await self.async_client.chat(messages, on_token=on_token, model=self._count_call(step))
 
-    def call_llm(self, messages: str | list[Dict[str, str]]) -> Dict:
-        """Use LLM to generate a response."""
+        return self._parse_response(json_response)
 
+    async def acall_llm_turn(self, messages: list[Dict[str, str]], session=None, step: str = None, on_token: Callable[[str], None] = None) -> Tuple[Dict, Dict[str, str]]:
+        """
+        acall_llm for multi-call conversations, also returns the assistant message exactly as generated.
+        Append that message (not a re-serialized version of the parsed response) to the conversation and
+        pass the same `session` on every call, so each request extends the previous one byte for byte
+        and the backend only prefills the new tokens.
+        """
+        json_response = await self.async_client.chat(self._to_messages(messages), on_token=on_token, session=session, model=self._count_call(step))
+        return self._parse_response(json_response), json_response['message']
+
+    def stream_llm(self, messages: str | list[Dict[str, str]]) -> Iterator[str]:
+        """Yield the raw LLM response content piece by piece as it is generated."""
+        yield from self.client.stream_chat(self._to_messages(messages))
+
+    async def astream_llm(self, messages: str | list[Dict[str, str]]) -> AsyncIterator[str]:
+        """Async version of stream_llm."""
+        async for delta in self.async_client.stream_chat(self._to_messages(messages)):
+            yield delta
+
+    def _count_call(self, step: str = None) -> str:
+        """Pick the model of a step and count the call, by agent, step and model."""
+        model = self.model_for(step)
+        metrics.incr("agent_llm_calls", agent=type(self).__name__, step=step or "default", model=model)
+        return model
+
+    def _to_messages(self, messages: str | list[Dict[str, str]]) -> list[Dict[str, str]]:
         if isinstance(messages, str):
-            messages = [{"role": "user", "content": messages}]
+            return [{"role": "user", "content": messages}]
         elif not isinstance(messages, list):
             raise TypeError("Expected `messages` to be a string or a list of dictionaries.")
+        return messages
 
-
-        # Chat with the API
-        response = self.client.chat(messages)        
-                
-        # Prepare the request to Ollama        
-        json_response = response.json()
-        
+    def _parse_response(self, json_response: Dict) -> Dict:
+        content = json_response['message']['content']
         try:
-            return json.loads(json_response['message']['content'])
+            # Salvage fenced, wrapped or truncated JSON locally, much cheaper than asking the LLM again
+            response, repairs = parse_json(content)
         except json.JSONDecodeError:
-            print(json_response['message']['content'])
+            print(content)
             raise ValueError("Failed to parse LLM response as JSON")
-                
\ No newline at end of file
+
+        if repairs:
+            print(f"Repaired LLM response JSON: {', '.join(repairs)}")
+
+        return self._validate(response)
+
+    def _validate(self, response: Dict) -> Dict:
+        """Check the response against response_model, keeping only the fields the model actually filled in."""
+        if self.response_model is None:
+            return response
+
+        try:
+            return self.response_model.model_validate(response).model_dump(exclude_unset=True, exclude_none=True)
+        except ValidationError as e:
+            # Backends without structured output support may still drift from the schema, keep what we got
+            print(f"Response does not match {self.response_model.__name__}: {str(e)}")
+            return response
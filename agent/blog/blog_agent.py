@@ -1,5 +1,8 @@
 import json
+import asyncio
 from util.time_exe import time_execution
+from util.async_utils import run_sync
+from util.metrics import metrics
 from agent.blog.blog_planner_agent import BlogPlannerAgent
 from agent.blog.blog_main_body_section_agent import BlogMainBodySectionAgent
 from agent.blog.blog_intro_agent import BlogIntroAgent
@@ -7,46 +10,72 @@ from agent.blog.blog_conclusion_agent import BlogConclusionAgent
 
 
 class BlogAgent:
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False):
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, max_concurrency=4, **kwargs):
         
-        """Initialize Agent with a base url and model name."""
+        """
+        Initialize Agent with a base url and model name.
+        `max_concurrency` caps how many sections are generated at once, match it to the backend's
+        parallel slots (e.g. OLLAMA_NUM_PARALLEL), 1 generates the sections one after the other.
+        """
         self.base_url = base_url
         self.model = model
         self.temperature = temperature
         self.stream = stream    
+        self.max_concurrency = max_concurrency
+
+        # Built once and shared by every query, they keep no per-query state. Extra BaseAgent options (e.g. cache) go to each
+        self.planner_agent = BlogPlannerAgent(base_url, model, temperature, stream, **kwargs)
+        self.intro_agent = BlogIntroAgent(base_url, model, temperature, stream, **kwargs)
+        self.mainbody_agent = BlogMainBodySectionAgent(base_url, model, temperature, stream, **kwargs)
+        self.conclusion_agent = BlogConclusionAgent(base_url, model, temperature, stream, **kwargs)
+
+    def warm_up(self) -> float:
+        """Load the model and prefill the system prompts of every sub agent, call it at startup."""
+        return sum(agent.warm_up() for agent in (self.planner_agent, self.intro_agent, self.mainbody_agent, self.conclusion_agent))
 
-    @time_execution        
     def execute(self, user_query: str, *args) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query, *args))
+
+    @time_execution        
+    async def aexecute(self, user_query: str, *args) -> str:
         """Execute the full pipeline: plan and execute tools, chaining responses."""
         try:
             
             print(f"{BlogAgent.__name__} : calling series of agents to generate blog for '{user_query}'")
                    
             # Generate a plan using the LLM
-            planner_agent = BlogPlannerAgent(self.base_url, self.model, self.temperature, self.stream)
-            intro_agent = BlogIntroAgent(self.base_url, self.model, self.temperature, self.stream)
-            mainbody_agent = BlogMainBodySectionAgent(self.base_url, self.model, self.temperature, self.stream)
-            conclusion_agent = BlogConclusionAgent(self.base_url, self.model, self.temperature, self.stream)
-
-            sections = planner_agent.execute(user_query)
+            sections = await self.planner_agent.aexecute(user_query)
             intro_section = next((section for section in sections if section["type"] == "Introduction"), None)
 
+            main_sections = [section for section in sections if section["type"] == "Main Body"]
+
+            # The intro and each main body section only depend on their own outline entry, so generate them together
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def generate(agent, section):
+                async with semaphore:
+                    return await agent.aexecute(json.dumps(section))
+
+            intro, *mains = await asyncio.gather(
+                generate(self.intro_agent, intro_section),
+                *[generate(self.mainbody_agent, section) for section in main_sections]
+            )
+
+            # Reassemble in outline order
             blog = ""
-            intro = intro_agent.execute(json.dumps(intro_section))
-            blog += f"{intro["heading"]}\n\n"
-            blog += f"{intro["body"]}\n\n"
+            blog += f"{intro['heading']}\n\n"
+            blog += f"{intro['body']}\n\n"
 
-            for section in sections:
-                if section["type"] == "Main Body":
-                    main = mainbody_agent.execute(json.dumps(section))
-                    blog += f"{main["heading"]}\n\n"
-                    blog += f"{main["body"]}\n\n"
-                    blog += f"{main["code"]}\n\n"
+            for main in mains:
+                blog += f"{main['heading']}\n\n"
+                blog += f"{main['body']}\n\n"
+                blog += f"{main['code']}\n\n"
 
 
-            conclusion = conclusion_agent.execute(json.dumps(blog))
-            blog += f"{conclusion["heading"]}\n\n"
-            blog += f"{conclusion["body"]}\n\n"
+            conclusion = await self.conclusion_agent.aexecute(self.conclusion_input(blog, [intro] + mains))
+            blog += f"{conclusion['heading']}\n\n"
+            blog += f"{conclusion['body']}\n\n"
                 
             return blog 
         
@@ -54,4 +83,21 @@ class BlogAgent:
             print(f'Exception in {BlogAgent.__name__}: {str(e)}')
             return f"Error executing plan: {str(e)}"
 
+    def conclusion_input(self, blog: str, sections: list) -> str:
+        """The whole blog for the conclusion writer, or only the gist of each section when the blog is over its token budget."""
+        client = self.conclusion_agent.llamaclient
+        content = json.dumps(blog)
+        if client.token_budget and client.count_tokens([client.system_prompt().message, {"role": "user", "content": content}]) > client.token_budget:
+            metrics.incr("blog_conclusion_digests")
+            content = json.dumps(self.digest(sections))
+        return content
+
+    @staticmethod
+    def digest(sections, words: int = 60) -> list:
+        """Compact written sections to their heading and first `words` words, code left out."""
+        return [
+            {"heading": section["heading"], "summary": " ".join(section["body"].split()[:words])}
+            for section in sections
+        ]
+
    
\ No newline at end of file
@@ -1,20 +1,37 @@
 import json
+from typing import List, Optional
+from pydantic import BaseModel
 from util.time_exe import time_execution
+from util.async_utils import run_sync
 from agent.base.base_agent import BaseAgent
 
+class IntroSection(BaseModel):
+    thought: Optional[str] = None
+    plan: Optional[List[str]] = None
+    section_heading: str
+    section_body: str
+    missing_information: Optional[bool] = None
+
+
 class BlogIntroAgent(BaseAgent):
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False):
+    response_model = IntroSection
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, **kwargs):
         """Initialize Agent the agent."""
-        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_intro_prompt)
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_intro_prompt, **kwargs)
 
-    @time_execution        
     def execute(self, user_query: str) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query))
+
+    @time_execution        
+    async def aexecute(self, user_query: str) -> str:
         """Execute the full pipeline: plan and execute tools, chaining responses."""
         try:
 
             # Call the LLM to generate a intro.
             print(f"{BlogIntroAgent.__name__} : calling LLM to generate a intro...")
-            intro = self.call_llm(user_query)
+            intro = await self.acall_llm(user_query)
 
             if "thought" in intro:
                 print("My next plan of action is: ", intro["thought"])
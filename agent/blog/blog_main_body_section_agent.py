@@ -1,21 +1,39 @@
 import json
+from typing import List, Optional
+from pydantic import BaseModel
 from util.time_exe import time_execution
+from util.async_utils import run_sync
 from agent.base.base_agent import BaseAgent
 
+class MainBodySection(BaseModel):
+    thought: Optional[str] = None
+    plan: Optional[List[str]] = None
+    section_heading: str
+    section_body: str
+    code_example: str
+    missing_information: Optional[bool] = None
+
+
 class BlogMainBodySectionAgent(BaseAgent):
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False):
+    response_model = MainBodySection
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, **kwargs):
         """Initialize Agent the agent."""
-        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_section_writer_prompt)
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_section_writer_prompt, **kwargs)
 
 
-    @time_execution        
     def execute(self, user_query: str) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query))
+
+    @time_execution        
+    async def aexecute(self, user_query: str) -> str:
         """Execute the full pipeline: plan and execute tools, chaining responses."""
         try:
 
             # Call the LLM to generate a main body section.
             print(f"{BlogMainBodySectionAgent.__name__} : calling LLM to generate a main body section...")            
-            main_body = self.call_llm(user_query)
+            main_body = await self.acall_llm(user_query)
 
             if "thought" in main_body:
                 print("My next plan of action is: ", main_body["thought"])
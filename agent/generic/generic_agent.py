@@ -1,21 +1,36 @@
 import json
+from typing import Callable, List, Optional
+from pydantic import BaseModel
 from util.time_exe import time_execution
+from util.async_utils import run_sync
 from agent.base.base_agent import BaseAgent
 
+class GenericResponse(BaseModel):
+    direct_response: str
+    thought: Optional[str] = None
+    plan: Optional[List[str]] = None
+
+
 class GenericAgent(BaseAgent):
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False):
+    response_model = GenericResponse
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, **kwargs):
         """Initialize Agent the agent."""
-        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt)
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt, **kwargs)
    
+    def execute(self, user_query: str, on_token: Callable[[str], None] = None) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query, on_token=on_token))
+
     @time_execution   
-    def execute(self, user_query: str) -> str:
-        """Execute the full pipeline: plan and execute tools, chaining responses."""
+    async def aexecute(self, user_query: str, on_token: Callable[[str], None] = None) -> str:
+        """Execute the full pipeline: plan and execute tools, chaining responses. Partial LLM output is streamed to `on_token`."""
        
         try:
 
             # Call the LLM to generate a response
             print(f"{GenericAgent.__name__} : calling LLM to answer user question...")
-            response = self.call_llm(user_query)
+            response = await self.acall_llm(user_query, on_token=on_token)
 
             if "thought" in response:
                 print("My plan of action is: ", response["thought"])
@@ -1,41 +1,119 @@
 import json
+import uuid
+import asyncio
+from typing import Callable, List, Optional
+from pydantic import BaseModel
 from util.time_exe import time_execution
+from util.async_utils import run_sync
+from util.metrics import metrics, TOKEN_BUCKETS
 from agent.base.base_agent import BaseAgent
+from agent.interactive.memory import Conversation, SessionStore
+from agent.interactive.summary_agent import ConversationSummaryAgent
+
+class InteractiveResponse(BaseModel):
+    direct_response: Optional[str] = None
+    clarification_needed: Optional[bool] = None
+    clarification_question: Optional[str] = None
+    thought: Optional[str] = None
+    plan: Optional[List[str]] = None
+
 
 class InteractiveAgent(BaseAgent):
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False):
-        """Initialize Agent the agent."""
-        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt)
+    response_model = InteractiveResponse
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, sessions: SessionStore = None,
+                 memory_budget: int = 2048, keep_messages: int = 4, max_clarifications: int = 3, **kwargs):
+        """
+        Initialize Agent the agent.
+        Conversations are kept per session in `sessions` (in memory by default, see SessionStore for SQLite).
+        Once a conversation is over `memory_budget` estimated tokens, all but its last `keep_messages` (at least 1)
+        messages are folded into a rolling summary. The user is asked at most `max_clarifications` questions per query.
+        """
+        if keep_messages < 1:
+            raise ValueError("keep_messages must be at least 1, the latest message is the one being answered")
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt, **kwargs)
+        self.sessions = sessions if sessions is not None else SessionStore()
+        self.memory_budget = memory_budget
+        self.keep_messages = keep_messages
+        self.max_clarifications = max_clarifications
+        self.summarizer = ConversationSummaryAgent(base_url, model, temperature, stream, **kwargs)
+
+    def warm_up(self) -> float:
+        """Warm up the agent and its summarizer."""
+        return super().warm_up() + self.summarizer.warm_up()
+
+    def execute(self, user_query: str, on_token: Callable[[str], None] = None, session: str = None) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query, on_token=on_token, session=session))
 
     @time_execution                
-    def execute(self, user_query: str) -> str:
+    async def aexecute(self, user_query: str, on_token: Callable[[str], None] = None, session: str = None) -> str:
         """
         Execute the agent's pipeline. If clarification is needed, ask the user.
+        Queries of the same `session` continue its conversation, without one a query starts its own.
+        Partial LLM output is streamed to `on_token` as it is generated.
         """
+        conversation = self.sessions.get(session) if session is not None else Conversation()
+        conversation.messages.append({"role": "user", "content": user_query})
+        turn_session = session or uuid.uuid4().hex
         try:
-            # Invoke agent to answer user question
-            print(f"{InteractiveAgent.__name__} : calling LLM to answer user question...")
-            response = self.call_llm(user_query)
-
-            if "thought" in response:
-                print("My plan of action is: ", response["thought"])
-
-            if "clarification_needed" in response and response["clarification_needed"]:
-                question_to_user = response.get("clarification_question", "Could you provide more details?")
-                print("I need more information: ", question_to_user)
-                user_input = input("User: ")  # Get user input for clarification
-                return self.execute(user_query + ". Response from user: " + user_input)
-            else:
-                # Check if the response requires user interaction
-                if "direct_response" in response:
+            for clarifications in range(self.max_clarifications + 1):
+                await self.compact(conversation)
+
+                # Invoke agent to answer user question, the conversation only grows between compactions so the backend reuses its KV cache
+                print(f"{InteractiveAgent.__name__} : calling LLM to answer user question...")
+                response, reply = await self.acall_llm_turn(conversation.to_messages(), session=f"{turn_session}:{conversation.compactions}", on_token=on_token)
+                conversation.messages.append({"role": "assistant", "content": reply["content"]})
+
+                if "thought" in response:
+                    print("My plan of action is: ", response["thought"])
+
+                if response.get("clarification_needed"):
+                    question_to_user = response.get("clarification_question", "Could you provide more details?")
+                    if clarifications == self.max_clarifications:
+                        metrics.incr("interactive_clarification_limit")
+                        return f"Unable to answer without more details: {question_to_user}"
+                    print("I need more information: ", question_to_user)
+                    user_input = await asyncio.to_thread(input, "User: ")  # Get user input for clarification, off the event loop
+                    conversation.messages.append({"role": "user", "content": user_input})
+                elif "direct_response" in response:
                     return response["direct_response"]
+                else:
+                    break
 
         except Exception as e:
             print(f'Exception in {InteractiveAgent.__name__}: {str(e)}')
             return f"Error executing plan: {str(e)}"
+        finally:
+            if session is not None:
+                self.sessions.put(session, conversation)
 
         return "Unable to process the query."
 
+    async def compact(self, conversation: Conversation) -> None:
+        """
+        Keep the conversation within the memory budget: fold every message but the last `keep_messages`
+        into the rolling summary, so each turn prefills about the same number of tokens however long the dialogue gets.
+        """
+        if not self.memory_budget or self.llamaclient.count_tokens(conversation.to_messages()) <= self.memory_budget:
+            return
+        split = max(0, len(conversation.messages) - self.keep_messages)
+        older, recent = conversation.messages[:split], conversation.messages[split:]
+        if not older:
+            return
+
+        before = self.llamaclient.count_tokens(conversation.to_messages())
+        try:
+            conversation.summary = await self.summarizer.aexecute(older, conversation.summary)
+        except Exception as e:
+            # The client still trims the request to its token budget, the summary can be tried again next turn
+            print(f"Could not summarize the conversation: {str(e)}")
+            return
+        conversation.messages = recent
+        conversation.compactions += 1
+        metrics.incr("memory_compactions")
+        metrics.observe("memory_compacted_tokens", before - self.llamaclient.count_tokens(conversation.to_messages()), buckets=TOKEN_BUCKETS)
+
     def create_system_prompt(self) -> str:
         """
         Extend the system prompt to include the ability to handle incomplete queries.
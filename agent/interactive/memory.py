@@ -0,0 +1,92 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from util.metrics import metrics
+
+
+@dataclass
+class Conversation:
+    """The message history of one session, with a summary standing in for the turns compacted away."""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    summary: Optional[str] = None
+    compactions: int = 0
+
+    def to_messages(self) -> List[Dict[str, str]]:
+        """The conversation as it is sent to the LLM, the summary first."""
+        if not self.summary:
+            return list(self.messages)
+        return [{"role": "user", "content": f"Summary of our conversation so far: {self.summary}"}] + self.messages
+
+
+class SessionStore:
+    """
+    Conversations by session id, the `max_sessions` most recently used in memory.
+    With a `path`, every conversation is also saved to a SQLite file, so sessions evicted from
+    memory (or from an earlier run) are loaded back from it.
+    """
+    def __init__(self, max_sessions: int = 1024, path: str = None):
+        self.max_sessions = max_sessions
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # session -> Conversation
+        self._db = self._open_db(path) if path else None
+
+    def get(self, session: str) -> Conversation:
+        """The conversation of a session, a new empty one for an unknown session."""
+        with self._lock:
+            conversation = self._memory.get(session)
+            if conversation is not None:
+                self._memory.move_to_end(session)
+                return conversation
+
+            if self._db is not None:
+                row = self._db.execute("SELECT messages, summary, compactions FROM sessions WHERE id = ?", (session,)).fetchone()
+                if row is not None:
+                    conversation = Conversation(json.loads(row[0]), row[1], row[2])
+                    self._remember(session, conversation)
+                    return conversation
+
+        return Conversation()
+
+    def put(self, session: str, conversation: Conversation) -> None:
+        with self._lock:
+            self._remember(session, conversation)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (id, messages, summary, compactions, updated) VALUES (?, ?, ?, ?, ?)",
+                    (session, json.dumps(conversation.messages, ensure_ascii=False), conversation.summary, conversation.compactions, time.time())
+                )
+                self._db.commit()
+
+    def delete(self, session: str) -> None:
+        with self._lock:
+            self._memory.pop(session, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session,))
+                self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _remember(self, session: str, conversation: Conversation) -> None:
+        self._memory[session] = conversation
+        self._memory.move_to_end(session)
+        while len(self._memory) > self.max_sessions:
+            self._memory.popitem(last=False)
+            metrics.incr("memory_sessions_evicted")
+        metrics.set("memory_sessions", len(self._memory))
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, messages TEXT NOT NULL, summary TEXT, compactions INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+        db.commit()
+        return db
@@ -0,0 +1,60 @@
+import json
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from util.time_exe import time_execution
+from util.async_utils import run_sync
+from agent.base.base_agent import BaseAgent
+
+class ConversationSummary(BaseModel):
+    summary: str
+
+
+class ConversationSummaryAgent(BaseAgent):
+    response_model = ConversationSummary
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, **kwargs):
+        """Initialize Agent the agent."""
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt, **kwargs)
+
+    def execute(self, messages: List[Dict[str, str]], summary: Optional[str] = None) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(messages, summary))
+
+    @time_execution
+    async def aexecute(self, messages: List[Dict[str, str]], summary: Optional[str] = None) -> str:
+        """Fold conversation turns into the summary of the turns before them, returns the new summary."""
+        print(f"{ConversationSummaryAgent.__name__} : calling LLM to summarize {len(messages)} messages...")
+        transcript = {"summary_so_far": summary or "", "messages": [{"role": message["role"], "content": message["content"]} for message in messages]}
+        response = await self.acall_llm(json.dumps(transcript, ensure_ascii=False))
+        return response["summary"]
+
+    def create_system_prompt(self) -> str:
+        """Create the system prompt for the LLM."""
+
+        info_json = {
+            "role": "Conversation Summarizer",
+            "instructions": [
+                "You receive the summary of a conversation so far and the messages that followed it",
+                "Write one updated summary covering both",
+                "Keep every fact, name, number, preference and open question the user gave, drop pleasantries and repetition",
+                "Assistant messages are JSON, summarize what the assistant answered or asked, not the JSON",
+                "Keep the summary under 150 words",
+            ],
+            "response_format": {
+                "type": "json",
+                "schema": {
+                    "summary": {
+                        "type": "string",
+                        "description": "the updated summary of the whole conversation"
+                    }
+                }
+            }
+        }
+
+        return f"""You are an AI assistant that keeps running summaries of conversations.
+    Configuration and instructions are provided in JSON format below:
+
+    {json.dumps(info_json, indent=2)}
+
+    Always respond with a JSON object following the response_format schema above.
+    """
@@ -1,48 +1,154 @@
 import json
+import time
+import asyncio
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel
 from util.time_exe import time_execution
-from util.utils import invoke_agent
+from util.async_utils import run_sync
+from util.utils import ainvoke_agent, agent_pool, agent_registry
+from util.metrics import metrics
 from agent.base.base_agent import BaseAgent
+from agent.planner.router import LexicalRouter, log_decision
+
+class AgentStage(BaseModel):
+    stage: str
+
+
+class SelectedAgent(BaseModel):
+    agent: Literal["ToolAgent", "BlogAgent", "GenericAgent", "InteractiveAgent"]
+    sequence: Optional[bool] = None
+    sequence_order: Optional[List[AgentStage]] = None
+    arguments: Optional[Dict[str, Any]] = None
+    query: Optional[str] = None
+    depends_on: Optional[List[int]] = None
+
+
+class PlannerResponse(BaseModel):
+    requires_agents: bool
+    selected_agents: List[SelectedAgent]
+    thought: Optional[str] = None
+
 
 class PlannerAgent(BaseAgent):
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False):
-        """Initialize Agent the agent."""
-        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt)
+    response_model = PlannerResponse
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, router: LexicalRouter = None, routing_log: str = None, **kwargs):
+        """
+        Initialize Agent the agent.
+        With a `router`, queries it is confident about skip the LLM routing call.
+        LLM routing decisions are appended to `routing_log` (JSONL), to train routers from.
+        Delegated agents are borrowed from the agent pool, built with the planner's own config.
+        """
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt, **kwargs)
+        self.agent_config = dict(base_url=base_url, model=model, temperature=temperature, stream=stream, **kwargs)
+        self.router = router
+        self.routing_log = routing_log
             
-    @time_execution   
+    def warm_up(self) -> float:
+        """Warm up the planner and every agent it can delegate to, leaving those agents ready in the agent pool."""
+        elapsed = super().warm_up()
+        for agent_name in agent_registry:
+            with agent_pool.lease(agent_name, **self.agent_config) as agent:
+                elapsed += agent.warm_up()
+        return elapsed
+
     def execute(self, user_query: str) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query))
+
+    @time_execution   
+    async def aexecute(self, user_query: str) -> str:
         """Execute the full pipeline: plan and execute tools, chaining responses."""
        
         try:
 
+            # Fast path, route locally when the router is sure
+            if self.router is not None:
+                agent_name, confidence = self.router.predict(user_query)
+                if agent_name is not None:
+                    print(f"{PlannerAgent.__name__} : routed to '{agent_name}' without LLM (confidence {confidence:.2f})")
+                    metrics.incr("planner_routes", source="router", agent=agent_name)
+                    return await ainvoke_agent(agent_name, "aexecute", user_query, agent_config=self.agent_config)
+
             # Identify which agent to invoke
             print(f"{PlannerAgent.__name__} : calling LLM to identify which agent to use...")
-            reponse = self.call_llm(user_query)
+            start = time.perf_counter()
+            reponse = await self.acall_llm(user_query, step="route")
+            routing_time = time.perf_counter() - start
 
             if "thought" in reponse:
                 print("My  plan of action is: ", reponse["thought"])
 
-            if "requires_agents" in reponse and reponse["requires_agents"] and "selected_agents" in reponse:
-                selected_agent = reponse["selected_agents"][0]
-                
-                if "sequence" in selected_agent and selected_agent["sequence"] and "sequence_order" in selected_agent:
-
-                    agent_name = selected_agent["agent"]
-                    agent_args = selected_agent["sequence_order"]
-                    
-                    # Execute the agent with its arguments
-                    return invoke_agent(str(agent_name), "execute", user_query, agent_args)
-
-                elif "agent" in selected_agent:
-                    agent_name = selected_agent["agent"]
-                    
-                    # Execute the agent with its arguments
-                    return invoke_agent(str(agent_name), "execute", user_query)                    
+            if "requires_agents" in reponse and reponse["requires_agents"] and reponse.get("selected_agents"):
+                selected_agents = reponse["selected_agents"]
+                for selected_agent in selected_agents:
+                    metrics.incr("planner_routes", source="llm", agent=selected_agent["agent"])
+
+                # Only single agent decisions are useful to train a router on
+                if self.routing_log and len(selected_agents) == 1:
+                    log_decision(self.routing_log, user_query, selected_agents[0]["agent"], routing_time)
+
+                return await self.run_selected_agents(user_query, selected_agents)
             
         except Exception as e:
             print(f'Exception in {PlannerAgent.__name__}: {str(e)}')
             return f"Error executing plan: {str(e)}"
             
 
+    async def run_selected_agents(self, user_query: str, selected_agents: List[Dict[str, Any]]) -> Any:
+        """
+        Run the selected agents as a dependency graph. Agents that don't depend on each other run
+        concurrently, an agent listing others in `depends_on` runs once they have finished and gets
+        their outputs along with its query. Returns the output of the agents nothing depends on.
+        """
+        count = len(selected_agents)
+        dependencies = {index: {dependency for dependency in selected_agent.get("depends_on") or [] if 0 <= dependency < count and dependency != index}
+                        for index, selected_agent in enumerate(selected_agents)}
+        self._check_cycles(selected_agents, dependencies)
+        metrics.observe("planner_agents_per_query", count)
+        tasks: Dict[int, asyncio.Future] = {}
+
+        async def run(index):
+            selected_agent = selected_agents[index]
+            query = selected_agent.get("query") or user_query
+            if dependencies[index]:
+                # Wait for this agent's own dependencies only, not for unrelated agents started alongside them
+                results = "\n\n".join([self._format_output(await tasks[dependency]) for dependency in sorted(dependencies[index])])
+                query = f"{query}\n\nResults from the previous steps:\n{results}"
+
+            args = [selected_agent["sequence_order"]] if selected_agent.get("sequence") and selected_agent.get("sequence_order") else []
+            return await ainvoke_agent(str(selected_agent["agent"]), "aexecute", query, *args, agent_config=self.agent_config)
+
+        for index in range(count):
+            tasks[index] = asyncio.ensure_future(run(index))
+            tasks[index].add_done_callback(lambda t: t.cancelled() or t.exception())  # Failures are raised by gather below, once
+        try:
+            outputs = dict(enumerate(await asyncio.gather(*[tasks[index] for index in range(count)])))
+        finally:
+            for task in tasks.values():
+                task.cancel()  # Only stops agents still running after another one failed
+
+        if count == 1:
+            return outputs[0]
+
+        used = set().union(*dependencies.values())
+        return "\n\n".join(self._format_output(outputs[index]) for index in range(count) if index not in used)
+
+    @staticmethod
+    def _check_cycles(selected_agents: List[Dict[str, Any]], dependencies: Dict[int, set]) -> None:
+        resolved = set()
+        pending = set(dependencies)
+        while pending:
+            ready = {index for index in pending if dependencies[index] <= resolved}
+            if not ready:
+                raise ValueError(f"Selected agents depend on each other in a cycle: {[selected_agents[index] for index in sorted(pending)]}")
+            resolved |= ready
+            pending -= ready
+
+    @staticmethod
+    def _format_output(output: Any) -> str:
+        return output if isinstance(output, str) else json.dumps(output, indent=2)
+
     def create_system_prompt(self) -> str:
         """Create the system prompt for the planner agent to determine and delegate tasks to appropriate agents."""
         agents_json = {
@@ -58,6 +164,8 @@ class PlannerAgent(BaseAgent):
                 "For queries requiring tools, forward the query to the tools agent (ToolAgent).",
                 "For general or conversational queries, forward the query to the generic agent (GenericAgent).",
                 "For questions if enough information is not provided and a clarification is needed, forward the query to the interactive agent (InteractiveAgent).",
+                "For queries with several independent parts, select one agent per part and give each agent only its part of the query in 'query'.",
+                "When an agent needs the output of other selected agents, list their positions (0 based) in 'depends_on'. Agents without dependencies run at the same time.",
                 "Always provide a JSON response that specifies the selected agent(s) and any required arguments."
             ],
             "agents": [
@@ -116,6 +224,17 @@ class PlannerAgent(BaseAgent):
                                     "type": "object",
                                     "description": "Arguments or parameters required by the agent.",
                                     "optional": True
+                                },
+                                "query": {
+                                    "type": "string",
+                                    "description": "The part of the user query this agent handles, defaults to the whole query.",
+                                    "optional": True
+                                },
+                                "depends_on": {
+                                    "type": "array",
+                                    "items": {"type": "integer"},
+                                    "description": "Positions of the selected agents whose output this agent needs.",
+                                    "optional": True
                                 }
                             }
                         },
@@ -166,6 +285,28 @@ class PlannerAgent(BaseAgent):
                             ]
                         }
                     },
+                    {
+                        "user": "What is the weather in Paris and what is AI?",
+                        "response": {
+                            "requires_agents": True,
+                            "thought": "This query has two independent parts, the tools agent gets the weather while the generic agent explains AI.",
+                            "selected_agents": [
+                                {"agent": "ToolAgent", "query": "What is the weather in Paris?"},
+                                {"agent": "GenericAgent", "query": "What is AI?"}
+                            ]
+                        }
+                    },
+                    {
+                        "user": "Convert 100 USD to EUR and write a short blog about what that amount buys in Paris.",
+                        "response": {
+                            "requires_agents": True,
+                            "thought": "The blog needs the conversion result, so the blog agent depends on the tools agent.",
+                            "selected_agents": [
+                                {"agent": "ToolAgent", "query": "What is 100 USD in EUR?"},
+                                {"agent": "BlogAgent", "query": "Write a short blog about what 100 USD converted to EUR buys in Paris.", "depends_on": [0]}
+                            ]
+                        }
+                    },
                     {
                         "user": "What is AI?",
                         "response": {
@@ -0,0 +1,152 @@
+import re
+import sys
+import json
+import math
+import time
+import random
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# The planner prompt's own examples, so a router works before anything has been logged
+SEED_EXAMPLES = [
+    ("Write a blog on the benefits of AI.", "BlogAgent"),
+    ("Write a blog about advent of AI", "BlogAgent"),
+    ("What is 100 USD in EUR?", "ToolAgent"),
+    ("Tell me about the weather in Tokyo.", "ToolAgent"),
+    ("How is the current weather at Boca Raton, Florida?", "ToolAgent"),
+    ("What is AI?", "GenericAgent"),
+    ("Tell me a joke?", "GenericAgent"),
+    ("What is the capital?", "InteractiveAgent"),
+]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words plus word bigrams."""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class LexicalRouter:
+    """
+    TF-IDF nearest-centroid classifier that picks the agent for a query without calling the LLM.
+    It is trained from logged planner decisions and only answers when the best agent is both
+    similar enough (`threshold`) and clearly ahead of the runner up (`margin`).
+    """
+    def __init__(self, threshold: float = 0.35, margin: float = 0.1):
+        self.threshold = threshold
+        self.margin = margin
+        self._idf: Dict[str, float] = {}
+        self._centroids: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_log(cls, path: str, include_seed: bool = True, **kwargs) -> "LexicalRouter":
+        """Train a router from a routing log written by PlannerAgent, missing logs are fine."""
+        examples = list(SEED_EXAMPLES) if include_seed else []
+        examples += [(entry["query"], entry["agent"]) for entry in read_log(path)]
+        router = cls(**kwargs)
+        router.fit(examples)
+        return router
+
+    def fit(self, examples: Iterable[Tuple[str, str]]) -> None:
+        """Train on (query, agent name) pairs."""
+        documents = [(Counter(tokenize(query)), agent) for query, agent in examples]
+        document_frequency = Counter(term for terms, _ in documents for term in terms)
+        idf = {term: math.log((1 + len(documents)) / (1 + count)) + 1 for term, count in document_frequency.items()}
+
+        sums = defaultdict(lambda: defaultdict(float))
+        for terms, agent in documents:
+            for term, weight in self._vector(terms, idf).items():
+                sums[agent][term] += weight
+
+        centroids = {agent: self._normalize(vector) for agent, vector in sums.items()}
+        with self._lock:
+            self._idf, self._centroids = idf, centroids
+
+    def predict(self, query: str) -> Tuple[Optional[str], float]:
+        """Returns (agent name, similarity), the agent is None when the router is not confident."""
+        with self._lock:
+            idf, centroids = self._idf, self._centroids
+
+        vector = self._vector(Counter(tokenize(query)), idf)
+        scores = sorted(
+            ((sum(weight * centroid.get(term, 0.0) for term, weight in vector.items()), agent) for agent, centroid in centroids.items()),
+            reverse=True
+        )
+        if not scores:
+            return None, 0.0
+
+        best, agent = scores[0]
+        runner_up = scores[1][0] if len(scores) > 1 else 0.0
+        if best >= self.threshold and best - runner_up >= self.margin:
+            return agent, best
+        return None, best
+
+    @classmethod
+    def _vector(cls, terms: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+        # Unknown terms carry no signal, sublinear tf keeps repeated words from dominating
+        return cls._normalize({term: (1 + math.log(count)) * idf[term] for term, count in terms.items() if term in idf})
+
+    @staticmethod
+    def _normalize(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+
+def log_decision(path: str, query: str, agent: str, latency: float) -> None:
+    """Append one LLM routing decision (and what it cost) to a JSONL routing log."""
+    with open(path, "a", encoding="utf-8") as log:
+        log.write(json.dumps({"query": query, "agent": agent, "latency": latency}) + "\n")
+
+
+def read_log(path: str) -> List[Dict]:
+    try:
+        with open(path, encoding="utf-8") as log:
+            return [json.loads(line) for line in log if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def evaluate(path: str, holdout: float = 0.2, seed: int = 0, **kwargs) -> Dict:
+    """
+    Train on part of a routing log and replay the held out part, comparing the router to the LLM.
+    `saved_seconds` is the LLM routing time the router would have saved on the held out queries,
+    net of the router's own time.
+    """
+    entries = read_log(path)
+    random.Random(seed).shuffle(entries)
+    split = int(len(entries) * (1 - holdout))
+    train, test = entries[:split], entries[split:]
+
+    router = LexicalRouter(**kwargs)
+    router.fit(list(SEED_EXAMPLES) + [(entry["query"], entry["agent"]) for entry in train])
+
+    routed = correct = 0
+    saved = router_seconds = 0.0
+    for entry in test:
+        start = time.perf_counter()
+        agent, _ = router.predict(entry["query"])
+        router_seconds += time.perf_counter() - start
+        if agent is None:
+            continue
+        routed += 1
+        if agent == entry["agent"]:
+            correct += 1
+            saved += entry.get("latency", 0.0)
+
+    return {
+        "train": len(train),
+        "test": len(test),
+        "coverage": routed / len(test) if test else 0.0,
+        "accuracy": correct / routed if routed else 0.0,
+        "misroutes": routed - correct,
+        "saved_seconds": saved - router_seconds,
+        "saved_seconds_per_query": (saved - router_seconds) / len(test) if test else 0.0,
+        "router_seconds_per_query": router_seconds / len(test) if test else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # python -m agent.planner.router routing_log.jsonl
+    print(json.dumps(evaluate(sys.argv[1] if len(sys.argv) > 1 else "routing_log.jsonl"), indent=2))
@@ -1,15 +1,46 @@
+import re
 import json
-from typing import Dict, List, Any
+import time
+import uuid
+import asyncio
+import functools
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from pydantic import BaseModel
+from util.metrics import metrics
+from util.tracing import tracer
 from util.time_exe import time_execution
+from util.async_utils import run_sync
+from util.json_stream import JSONStreamParser
 from agent.base.base_agent import BaseAgent
 from agent.tool.tool_registry import Tool, global_tool_registry
 
+class ToolCall(BaseModel):
+    tool: str
+    args: Dict[str, Any] = {}
+
+
+class ToolPlan(BaseModel):
+    # Backends generate structured output in field order, tool calls come first so they can start
+    # while the model is still writing its thought and plan, see ToolAgent.acall_llm_plan
+    requires_tools: bool
+    tool_calls: Optional[List[ToolCall]] = None
+    thought: Optional[str] = None
+    plan: Optional[List[str]] = None
+    direct_response: Optional[str] = None
+
+
 class ToolAgent(BaseAgent):
-    def __init__(self, base_url="http://localhost:11434", model="qwen2.5:32b", temperature=0.0, stream=False, process_multi_tool = True, load_default_tools = True):    
-        """Initialize the agent."""
-        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt)
+    response_model = ToolPlan
+
+    def __init__(self, base_url="http://localhost:11434", model=None, temperature=0.0, stream=False, process_multi_tool = True, load_default_tools = True, max_workers = 8, **kwargs):    
+        """Initialize the agent. Up to `max_workers` tool calls run at the same time."""
+        super().__init__(base_url, model, temperature, stream, system_prompt_func=self.create_system_prompt, **kwargs)
         self.process_multi_tool = process_multi_tool
         self.tools: Dict[str, Tool] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{ToolAgent.__name__}-tool")
 
         # Automatically load tools from the global registry
         if load_default_tools:
@@ -23,6 +54,7 @@ class ToolAgent(BaseAgent):
     def add_tool(self, tool: Tool) -> None:
         """Register a new tool with the agent."""
         self.tools[tool.name] = tool
+        self.llamaclient.invalidate_system_prompt()  # The tool list is part of the system prompt
     
     def get_available_tools(self) -> List[str]:
         """Get list of available tool descriptions."""
@@ -34,17 +66,116 @@ class ToolAgent(BaseAgent):
             raise ValueError(f"Tool '{tool_name}' not found. Available tools: {list(self.tools.keys())}")
         
         tool = self.tools[tool_name]
-        return tool.func(**kwargs)        
-        
+        start = time.perf_counter()
+        with tracer.span(f"tool.{tool_name}", kind="tool", tool=tool_name):
+            try:
+                return tool(**kwargs)
+            finally:
+                metrics.observe("tool_latency_seconds", time.perf_counter() - start, tool=tool_name)
+
+    async def run_tool_calls(self, tool_calls: List[Dict[str, Any]], started: Dict[int, asyncio.Future] = None) -> List[str]:
+        """
+        Run the tool calls of a plan on the worker pool and return their responses in plan order.
+        Calls that don't depend on each other run concurrently, a call with a "$<index>" argument
+        runs once the call at that index has finished and gets its response as the argument value.
+        `started` holds calls that are already running by index, e.g. dispatched while the plan was generated.
+        """
+        self._check_cycles(tool_calls)
+        tasks = dict(started or {})
+        for index, tool_call in enumerate(tool_calls):
+            if index not in tasks:
+                tasks[index] = self.start_tool_call(tool_call, len(tool_calls), tasks)
+        return list(await asyncio.gather(*[tasks[index] for index in range(len(tool_calls))]))
+
+    def start_tool_call(self, tool_call: Dict[str, Any], count: int, tasks: Dict[int, asyncio.Future]) -> asyncio.Future:
+        """
+        Start one tool call of a plan of `count` calls as a task, it waits for the tasks (by index in `tasks`)
+        of the calls its "$<index>" arguments refer to.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def run():
+            tool_name = tool_call["tool"]
+            tool_args = {}
+            for name, value in tool_call.get("args", {}).items():
+                tool_args[name] = await tasks[int(value[1:])] if self._is_reference(value, count) else value
+            print(f"Invoking tool: {str(tool_name)} with args: {str(tool_args)}")
+
+            # Tools do blocking I/O, run them on the worker pool instead of the event loop (in this context, so their spans nest)
+            call = functools.partial(contextvars.copy_context().run, self.use_tool, tool_name, **tool_args)
+            tool_response = await loop.run_in_executor(self.executor, call)
+            print(f"Tool response: {str(tool_response)}")
+            return str(tool_response)
+
+        task = asyncio.ensure_future(run())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Unused results (the plan changed its mind) must not warn
+        return task
+
+    async def acall_llm_plan(self, messages: List[Dict[str, str]], session: str, step: str = None) -> Tuple[Dict, Dict[str, str], Dict[int, asyncio.Future]]:
+        """
+        Stream the next plan and start each of its tool calls as soon as the call has been generated,
+        while the model is still writing the rest. Generation is stopped if the model goes on after the plan's JSON object.
+        Returns the plan, the assistant message as generated and the started tool calls by index.
+        """
+        parser = JSONStreamParser(arrays=("tool_calls",))
+        started: Dict[int, asyncio.Future] = {}
+        dispatched_at = {}
+
+        async with contextlib.aclosing(self.async_client.stream_chat(messages, session=session, model=self._count_call(step))) as stream:
+            async for delta in stream:
+                if parser.done and delta.strip():
+                    break  # The model kept writing after the plan, closing the stream stops the generation
+                for _, index, tool_call in parser.feed(delta):
+                    if not isinstance(tool_call, dict) or "tool" not in tool_call or not isinstance(tool_call.get("args", {}), dict):
+                        continue
+                    # Calls referring to calls that haven't started (or come later) wait for the complete plan
+                    references = [int(value[1:]) for value in tool_call.get("args", {}).values() if isinstance(value, str) and re.fullmatch(r"\$\d+", value)]
+                    if all(reference in started for reference in references):
+                        started[index] = self.start_tool_call(tool_call, index, started)
+                        dispatched_at[index] = time.perf_counter()
+
+        end = time.perf_counter()
+        for index, at in dispatched_at.items():
+            metrics.incr("tool_calls_dispatched_early")
+            metrics.observe("tool_dispatch_lead_seconds", end - at)
+
+        content = parser.text[:parser.end] if parser.done else parser.text
+        reply = {"role": "assistant", "content": content}
+        return self._parse_response({"message": reply}), reply, started
+
+    def _check_cycles(self, tool_calls: List[Dict[str, Any]]) -> None:
+        resolved = set()
+        pending = dict(enumerate(tool_calls))
+        while pending:
+            ready = [index for index, tool_call in pending.items() if self._dependencies(tool_call, len(tool_calls)) <= resolved]
+            if not ready:
+                raise ValueError(f"Tool calls depend on each other in a cycle: {list(pending.values())}")
+            for index in ready:
+                resolved.add(index)
+                del pending[index]
+
+    @staticmethod
+    def _is_reference(value: Any, count: int) -> bool:
+        return isinstance(value, str) and re.fullmatch(r"\$\d+", value) is not None and int(value[1:]) < count
+
+    def _dependencies(self, tool_call: Dict[str, Any], count: int) -> set:
+        return {int(value[1:]) for value in tool_call.get("args", {}).values() if self._is_reference(value, count)}
    
-    @time_execution   
     def execute(self, user_query: str) -> str:
+        """Synchronous wrapper around aexecute."""
+        return run_sync(self.aexecute(user_query))
+
+    @time_execution   
+    async def aexecute(self, user_query: str) -> str:
         """Execute the full pipeline: plan and execute tools, chaining responses."""
         try:
 
             # Generate a plan using the LLM
             print(f"{ToolAgent.__name__} : calling LLM to identify which tool to use...")
-            plan = self.call_llm(user_query)
+            # The conversation is only ever appended to, so every re-plan reuses the backend's KV cache of the previous prompt
+            session = uuid.uuid4().hex
+            messages = [{"role": "user", "content": user_query}]
+            plan, reply, started = await self.acall_llm_plan(messages, session, step="plan")
 
             while True:
 
@@ -54,35 +185,18 @@ class ToolAgent(BaseAgent):
                 if "direct_response" in plan or not plan.get("requires_tools", True):
                     # If no tools are required, capture the direct response and exit
                     return plan["direct_response"]
-                    
-
-                # If tools are required, execute the tool calls sequentially (as of now call only for the first tool 
-                # and exist incase input of this tool response is required for the next tool call)
-                for tool_call in plan["tool_calls"]:
-                    tool_name = tool_call["tool"]
-                    tool_args = tool_call["args"]
-                    print(f"Invoking tool: {str(tool_name)} with args: {str(tool_args)}")
-                    
-                    # Execute the tool with its arguments
-                    tool_response = self.use_tool(tool_name, **tool_args)                             
-                    print(f"Tool response: {str(tool_response)}")   
-
-                    # If multiple tool calls are required, update the query for the next tool call
-                    if self.process_multi_tool:
-                        # Update the query for the next tool or LLM call
-                        messages = [
-                            {"role": "user", "content": user_query},
-                            {"role": "assistant", "content":  plan['thought']},
-                            {"role": "tool", "content":  tool_response}
-                        ]
-            
-                        # Re-plan using the updated input
-                        plan = self.call_llm(messages)
-                        break;
-                   
-                     # If multiple tool calls are not required, return the response from tool
-                    else:
-                        return tool_response
+
+                # If tools are required, run every tool call of the plan, independent ones in parallel
+                tool_responses = await self.run_tool_calls(plan["tool_calls"], started)
+
+                # If multiple tool calls are not required, return the response from tools
+                if not self.process_multi_tool:
+                    return "\n".join(tool_responses)
+
+                # Hand all the tool responses back to the LLM in a single follow up turn and re-plan
+                messages = messages + [{"role": "assistant", "content": reply["content"]}]
+                messages += [{"role": "tool", "content": tool_response} for tool_response in tool_responses]
+                plan, reply, started = await self.acall_llm_plan(messages, session, step="replan")
             
         except Exception as e:
             print(f'Exception in {ToolAgent.__name__}: {str(e)}')
@@ -102,7 +216,8 @@ class ToolAgent(BaseAgent):
                 "When you receive a tool response, use it to format an answer to the orginal user question, without using tools.",
                 "Use tools only when they are necessary for the task",
                 "If a query can be answered directly, respond with a simple message instead of using tools",
-                "When tools are needed, plan their usage efficiently to minimize tool calls"
+                "When tools are needed, plan their usage efficiently to minimize tool calls",
+                "Tool calls run in parallel. If a tool call needs the output of an earlier tool call in the same plan, set that argument to \"$<index>\" where <index> is the 0-based position of the earlier call in tool_calls"
             ],
             "tools": [
                 {
@@ -125,22 +240,6 @@ class ToolAgent(BaseAgent):
                         "type": "boolean",
                         "description": "whether tools are needed for this query"
                     },
-                    "thought": {
-                        "type": "string", 
-                        "description": "reasoning about how to solve the task (when tools are needed)",
-                        "optional": True
-                    },
-                    "plan": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "steps to solve the task (when tools are needed)",
-                        "optional": True
-                    },
-                    "direct_response": {
-                        "type": "string",
-                        "description": "final response if no tools are needs",
-                        "optional": True
-                    },
                     "tool_calls": {
                         "type": "array",
                         "items": {
@@ -158,6 +257,22 @@ class ToolAgent(BaseAgent):
                         },
                         "description": "tools to call in sequence (when tools are needed)",
                         "optional": True
+                    },
+                    "thought": {
+                        "type": "string", 
+                        "description": "reasoning about how to solve the task (when tools are needed)",
+                        "optional": True
+                    },
+                    "plan": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "steps to solve the task (when tools are needed)",
+                        "optional": True
+                    },
+                    "direct_response": {
+                        "type": "string",
+                        "description": "final response if no tools are needs",
+                        "optional": True
                     }
                 },
                 "examples": [
@@ -165,11 +280,6 @@ class ToolAgent(BaseAgent):
                         "user": "Convert 100 USD to EUR",
                         "response": {
                             "requires_tools": True,
-                            "thought": "I need to use the currency conversion tool to convert USD to EUR",
-                            "plan": [
-                                "Use convert_currency tool to convert 100 USD to EUR",
-                                "Return the conversion result"
-                            ],
                             "tool_calls": [
                                 {
                                     "tool": "convert_currency",
@@ -179,6 +289,11 @@ class ToolAgent(BaseAgent):
                                         "to_currency": "EUR"
                                     }
                                 }
+                            ],
+                            "thought": "I need to use the currency conversion tool to convert USD to EUR",
+                            "plan": [
+                                "Use convert_currency tool to convert 100 USD to EUR",
+                                "Return the conversion result"
                             ]
                         }
                     },
@@ -186,11 +301,6 @@ class ToolAgent(BaseAgent):
                         "user": "What's 500 Japanese Yen in British Pounds?",
                         "response": {
                             "requires_tools": True,
-                            "thought": "I need to convert JPY to GBP using the currency converter",
-                            "plan": [
-                                "Use convert_currency tool to convert 500 JPY to GBP",
-                                "Return the conversion result"
-                            ],
                             "tool_calls": [
                                 {
                                     "tool": "convert_currency",
@@ -200,6 +310,11 @@ class ToolAgent(BaseAgent):
                                         "to_currency": "GBP"
                                     }
                                 }
+                            ],
+                            "thought": "I need to convert JPY to GBP using the currency converter",
+                            "plan": [
+                                "Use convert_currency tool to convert 500 JPY to GBP",
+                                "Return the conversion result"
                             ]
                         }
                     },
@@ -1,19 +1,101 @@
+import json
+import time
 import inspect
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import _GenericAlias
-from typing import Callable, Any, Dict, get_type_hints, Optional
+from typing import Callable, Any, Dict, get_type_hints, Optional, Tuple
+from util.metrics import metrics
 
 global_tool_registry = {}
 
+class ToolCache:
+    """LRU cache of tool results that expire after `ttl` seconds."""
+    def __init__(self, ttl: float, size: int = 128):
+        self.ttl = ttl
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires at, result)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Returns (found, result)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            self._entries.pop(key, None)
+            self.misses += 1
+            return False, None
+
+    def set(self, key: str, result: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0, "entries": len(self._entries)}
+
 @dataclass
 class Tool:
     name: str
     description: str
     func: Callable[..., str]
     arguments: Dict[str, Dict[str, str]]
+    max_concurrency: Optional[int] = None  # Max parallel calls of this tool, None for no limit
+    cache: Optional[ToolCache] = None  # Results cache, see tool(cache_ttl=...)
+    _slots: Optional[threading.BoundedSemaphore] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.max_concurrency:
+            self._slots = threading.BoundedSemaphore(self.max_concurrency)
     
     def __call__(self, *args, **kwargs) -> str:
-        return self.func(*args, **kwargs)
+        if self.cache is None:
+            return self._run(*args, **kwargs)
+
+        key = self.cache_key(*args, **kwargs)
+        found, result = self.cache.get(key)
+        metrics.incr("tool_cache_hits" if found else "tool_cache_misses", tool=self.name)
+        if found:
+            return result
+
+        result = self._run(*args, **kwargs)
+        if not is_error_result(result):
+            self.cache.set(key, result)
+        return result
+
+    def cache_key(self, *args, **kwargs) -> str:
+        """Key a call on its normalized arguments, so `Paris` and ` paris` given by position or name are the same call."""
+        bound = inspect.signature(self.func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = {name: value.strip().casefold() if isinstance(value, str) else value for name, value in bound.arguments.items()}
+        return json.dumps(arguments, sort_keys=True, default=str)
+
+    def _run(self, *args, **kwargs) -> str:
+        if self._slots is None:
+            return self.func(*args, **kwargs)
+        with self._slots:
+            return self.func(*args, **kwargs)
+
+def is_error_result(result: Any) -> bool:
+    """Tools report failures as an "Error..." string or an {"Error": ...} dict, those are never cached."""
+    if isinstance(result, str):
+        return result.startswith("Error")
+    return isinstance(result, dict) and "Error" in result
+
+def tool_cache_stats() -> Dict[str, Dict]:
+    """Get cache stats of every registered tool that has a cache."""
+    return {tool.name: tool.cache.stats() for tool in global_tool_registry.values() if tool.cache is not None}
 
 def parse_docstring_params(docstring: str) -> Dict[str, str]:
     """Extract parameter descriptions from docstring."""
@@ -47,7 +129,11 @@ def get_type_description(type_hint: Any) -> str:
             return f"one of {type_hint.__args__}"
     return type_hint.__name__
 
-def tool(name: str = None):
+def tool(name: str = None, max_concurrency: int = None, cache_ttl: float = None, cache_size: int = 128):
+    """
+    Register a function as a tool.
+    With `cache_ttl` (seconds) results are cached per normalized arguments, keeping at most `cache_size` of them.
+    """
     def decorator(func: Callable[..., str]) -> Tool:
         tool_name = name or func.__name__
         description = inspect.getdoc(func) or "No description available"
@@ -67,7 +153,9 @@ def tool(name: str = None):
             name=tool_name,
             description=description.split('\n\n')[0],
             func=func,
-            arguments=params
+            arguments=params,
+            max_concurrency=max_concurrency,
+            cache=ToolCache(cache_ttl, cache_size) if cache_ttl else None
         )
         global_tool_registry[func.__name__] = tool
         return tool
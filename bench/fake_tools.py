@@ -0,0 +1,70 @@
+import time
+import functools
+from contextlib import contextmanager
+from typing import Dict
+import tool.tools  # Registers the real tools
+from agent.tool.tool_registry import global_tool_registry
+
+# Fixed rates to USD, enough for deterministic conversions
+_RATES = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "JPY": 150.0, "INR": 83.0}
+
+
+def _convert_currency(amount: float, from_currency: str, to_currency: str) -> str:
+    from_rate = _RATES.get(str(from_currency).upper())
+    to_rate = _RATES.get(str(to_currency).upper())
+    if not from_rate or not to_rate:
+        return f"Error: No rate found for {to_currency}"
+    return f"{float(amount) / from_rate * to_rate:.2f} {to_currency.upper()}"
+
+
+def _current_weather(city_name: str, country_name: str) -> Dict:
+    return str({"City": city_name, "Temperature (°C)": 24.0, "Weather": "clear sky", "Humidity (%)": 60, "Wind Speed (m/s)": 3.5})
+
+
+def _country_for_city(city_name: str) -> str:
+    return "USA"
+
+
+def _get_current_location() -> str:
+    return "Port Blair, IN"
+
+
+FAKE_TOOLS = {
+    "convert_currency": _convert_currency,
+    "current_weather": _current_weather,
+    "country_for_city": _country_for_city,
+    "get_current_location": _get_current_location,
+}
+
+
+@contextmanager
+def fake_tools(latency: float = 0.0):
+    """
+    Serve the registered tools from local fakes, each call taking `latency` seconds.
+    The Tool objects keep their name, description and arguments so agent prompts don't change.
+    """
+    originals = {}
+    for name, fake in FAKE_TOOLS.items():
+        registered = global_tool_registry[name]
+        originals[name] = (registered.func, registered.cache)
+        registered.func = _with_latency(fake, latency)
+        if registered.cache is not None:
+            # Start cold so every run sees the same hits and misses
+            registered.cache = type(registered.cache)(registered.cache.ttl, registered.cache.size)
+    try:
+        yield
+    finally:
+        for name, (func, cache) in originals.items():
+            global_tool_registry[name].func = func
+            global_tool_registry[name].cache = cache
+
+
+def _with_latency(func, latency: float):
+    if not latency:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        time.sleep(latency)
+        return func(*args, **kwargs)
+    return wrapper
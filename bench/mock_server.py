@@ -0,0 +1,369 @@
+import re
+import json
+import time
+import socket
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import requests
+from agent.planner.router import LexicalRouter, SEED_EXAMPLES
+
+
+@dataclass
+class Latency:
+    """Synthetic generation time: `ttft` plus prompt processing before the first token, then `per_token` for each generated token."""
+    ttft: float = 0.02
+    per_prompt_token: float = 0.0001
+    per_token: float = 0.002
+    jitter: float = 0.0  # +/- fraction applied to every delay
+    seed: int = 0
+    load: float = 0.0  # Seconds to load a model that isn't loaded (first use, or idle past its keep_alive)
+
+
+# Token counts and nanosecond timings Ollama puts on its final response
+BACKEND_STATS = ("prompt_eval_count", "eval_count", "total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+
+
+def keep_alive_seconds(keep_alive) -> float:
+    """Ollama's keep_alive as seconds: a number, a duration like "30m", negative for forever."""
+    if keep_alive is None:
+        return 300.0
+    if isinstance(keep_alive, (int, float)):
+        return float("inf") if keep_alive < 0 else float(keep_alive)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(keep_alive).strip())
+    if not match:
+        return 300.0
+    value = float(match.group(1))
+    return float("inf") if value < 0 else value * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def request_key(payload: Dict) -> str:
+    """Recordings are keyed on what the model sees, so they replay under any model name."""
+    material = {"messages": payload.get("messages"), "format": payload.get("format")}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class Recordings:
+    """LLM responses recorded from a real backend, stored as JSONL."""
+    def __init__(self, path: str = None):
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, encoding="utf-8") as file:
+                    for line in file:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries[entry["key"]] = entry
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def add(self, key: str, content: str, stats: Dict) -> None:
+        entry = {"key": key, "content": content, **stats}
+        with self._lock:
+            known = key in self._entries
+            self._entries[key] = entry
+            if self.path and not known:
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MockOllamaServer:
+    """
+    Local stand-in for Ollama's /api/chat, for benchmarks that need no GPU and no network.
+
+    Requests are answered from `recordings` when the exact conversation was recorded, otherwise
+    with a synthetic response shaped for the agent that sent it (told apart by its system prompt).
+    With `upstream` set every request is forwarded to that real backend and recorded instead.
+    Like Ollama, it keeps the prompts of the last `cache_slots` requests and only prefills (and
+    reports in prompt_eval_count) the messages after the longest prefix it has seen, 0 disables that.
+    The time spent answering each request is kept in `intervals`, on the perf_counter clock.
+    """
+    def __init__(self, port: int = 0, latency: Latency = None, recordings: Recordings = None, upstream: str = None, words: int = 120, cache_slots: int = 4):
+        self.latency = latency or Latency()
+        self.recordings = recordings if recordings is not None else Recordings()
+        self.upstream = upstream
+        self.words = words
+        self.cache_slots = cache_slots
+        self._prefixes: List[List[str]] = []  # Message digests of recent prompts, most recent last
+        self._loaded: Dict[str, float] = {}  # model -> time it gets unloaded
+        self.intervals: List[Tuple[float, float]] = []
+        self.counts = {"requests": 0, "replayed": 0, "synthetic": 0, "recorded": 0, "loads": 0}
+        self._random = random.Random(self.latency.seed)
+        self._router = LexicalRouter()
+        self._router.fit(SEED_EXAMPLES)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def busy_time(self, start: float, end: float) -> float:
+        """Time within [start, end] during which at least one request was being answered."""
+        with self._lock:
+            intervals = sorted((max(a, start), min(b, end)) for a, b in self.intervals if b > start and a < end)
+
+        busy = 0.0
+        current_start = current_end = None
+        for a, b in intervals:
+            if current_end is None or a > current_end:
+                if current_end is not None:
+                    busy += current_end - current_start
+                current_start, current_end = a, b
+            else:
+                current_end = max(current_end, b)
+        if current_end is not None:
+            busy += current_end - current_start
+        return busy
+
+    def respond(self, payload: Dict) -> Tuple[str, Dict, bool]:
+        """Returns (content, token stats, whether to simulate latency) for a chat request."""
+        key = request_key(payload)
+
+        if self.upstream:
+            body = dict(payload, stream=False)
+            response = requests.post(f"{self.upstream}/api/chat", json=body, timeout=600).json()
+            content = response["message"]["content"]
+            stats = {name: response[name] for name in BACKEND_STATS if name in response}
+            self.recordings.add(key, content, stats)
+            self._count("recorded")
+            return content, stats, False
+
+        recorded = self.recordings.get(key)
+        if recorded is not None:
+            self._count("replayed")
+            stats = {name: recorded[name] for name in BACKEND_STATS if name in recorded}
+            return recorded["content"], stats, True
+
+        self._count("synthetic")
+        return json.dumps(self.synthetic_response(payload["messages"])), {}, True
+
+    def synthetic_response(self, messages: List[Dict]) -> Dict:
+        """A plausible response for the agent whose system prompt starts the conversation."""
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        query = next((message["content"] for message in reversed(messages) if message["role"] == "user"), "")
+        last = messages[-1] if messages else {}
+
+        if "planner agent" in system:
+            agent, _ = self._router.predict(query)
+            agent = agent or "GenericAgent"
+            selected = {"agent": agent}
+            if agent == "BlogAgent":
+                selected.update({"sequence": True, "sequence_order": [{"stage": "BlogPlannerAgent"}, {"stage": "BlogMainBodySectionAgent"}, {"stage": "BlogIntroConclusionAgent"}]})
+            return {"requires_agents": True, "thought": f"Delegating to {agent}.", "selected_agents": [selected]}
+
+        if "Blog Planning AI" in system:
+            sections = [{"name": "Introduction", "description": f"Overview of {query}", "type": "Introduction"}]
+            sections += [{"name": f"Part {index}", "description": f"Part {index} of {query}", "type": "Main Body"} for index in range(1, 4)]
+            sections += [{"name": "Conclusion", "description": "Wrap up", "type": "Conclusion"}]
+            return {"thought": "Outline the blog.", "sections": sections}
+
+        if "Section Writer AI" in system:
+            return {"section_heading": "## Section", "section_body": self._text(query), "code_example": "```python\nprint('hello')\n```"}
+
+        if "Intro Writer AI" in system or "Conclusion Writer AI" in system:
+            return {"section_heading": "## Heading", "section_body": self._text(query, self.words // 2)}
+
+        if "running summaries of conversations" in system:
+            return {"summary": self._text(query, self.words // 2)}
+
+        if "using tools when necessary" in system:
+            if last.get("role") == "tool":
+                return {"requires_tools": False, "direct_response": f"Based on the tools: {last['content']}"}
+            return self._tool_plan(query)
+
+        return {"direct_response": self._text(query), "thought": "Answer directly."}
+
+    def _tool_plan(self, query: str) -> Dict:
+        lowered = query.lower()
+        if "weather" in lowered:
+            match = re.search(r"weather (?:at|in) ([^,?]+)(?:,\s*([^?]+))?", query, re.IGNORECASE)
+            if match:
+                calls = [{"tool": "current_weather", "args": {"city_name": match.group(1).strip(), "country_name": (match.group(2) or "USA").strip()}}]
+            else:
+                calls = [{"tool": "get_current_location", "args": {}}, {"tool": "current_weather", "args": {"city_name": "$0", "country_name": "$0"}}]
+            return {"requires_tools": True, "tool_calls": calls, "thought": f"Look up the weather. {self._text(query, 40)}"}
+
+        if "currency" in lowered or re.search(r"\b\d+(\.\d+)?\s*[A-Z]{3}\b", query):
+            amount = re.search(r"\d+(\.\d+)?", query)
+            calls = [{"tool": "convert_currency", "args": {"amount": float(amount.group(0)) if amount else 1.0, "from_currency": "INR", "to_currency": "JPY"}}]
+            return {"requires_tools": True, "tool_calls": calls, "thought": f"Convert the currency. {self._text(query, 40)}"}
+
+        return {"requires_tools": False, "direct_response": self._text(query)}
+
+    def _text(self, query: str, words: int = None) -> str:
+        vocabulary = re.findall(r"\w+", query.lower()) or ["lorem"]
+        return " ".join(vocabulary[index % len(vocabulary)] for index in range(words or self.words))
+
+    def uncached_tokens(self, messages: List[Dict]) -> int:
+        """Prompt tokens left to prefill after the longest cached prefix, the prompt becomes the newest cached one."""
+        digests = [hashlib.sha256(json.dumps(message, sort_keys=True).encode("utf-8")).hexdigest() for message in messages]
+        with self._lock:
+            cached = 0
+            for prefix in self._prefixes:
+                common = 0
+                while common < min(len(prefix), len(digests)) and prefix[common] == digests[common]:
+                    common += 1
+                cached = max(cached, common)
+            if self.cache_slots:
+                self._prefixes = (self._prefixes + [digests])[-self.cache_slots:]
+            else:
+                cached = 0
+
+        # The last message always has to be evaluated
+        cached = min(cached, len(messages) - 1)
+        return estimate_tokens("".join(message["content"] for message in messages[cached:]))
+
+    def load_time(self, payload: Dict) -> float:
+        """Seconds this request spends loading its model, and keep the model loaded for its keep_alive."""
+        now = time.monotonic()
+        model = payload.get("model")
+        with self._lock:
+            loaded = self._loaded.get(model, 0.0) > now
+            self._loaded[model] = now + keep_alive_seconds(payload.get("keep_alive"))
+        if not loaded:
+            self._count("loads")
+        return 0.0 if loaded else self.latency.load
+
+    def _delay(self, seconds: float) -> None:
+        if self.latency.jitter:
+            with self._lock:
+                seconds *= 1 + self._random.uniform(-self.latency.jitter, self.latency.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Small chunk writes must not wait for delayed ACKs, that would show up as client overhead
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                # Health checks of llm.base.balancer
+                if self.path.rstrip("/") != "/api/tags":
+                    self.send_error(404)
+                    return
+                with server._lock:
+                    models = [{"name": model} for model in server._loaded]
+                self._send_json({"models": models})
+
+            def do_POST(self):
+                start = time.perf_counter()
+                if self.path.rstrip("/") != "/api/chat":
+                    self.send_error(404)
+                    return
+
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                server._count("requests")
+                load = server.load_time(payload)
+                server._delay(load)
+                if not payload.get("messages"):
+                    # Ollama loads the model and returns right away for an empty conversation
+                    self._send_json({"model": payload.get("model"), "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "load", "load_duration": int(load * 1e9)})
+                    with server._lock:
+                        server.intervals.append((start, time.perf_counter()))
+                    return
+                content, stats, simulate = server.respond(payload)
+                num_predict = (payload.get("options") or {}).get("num_predict")
+                if num_predict and num_predict > 0:
+                    content = content[:num_predict * 4]
+
+                prompt_tokens = stats.get("prompt_eval_count") or server.uncached_tokens(payload["messages"])
+                tokens = stats.get("eval_count") or estimate_tokens(content)
+                prompt_eval = server.latency.ttft + prompt_tokens * server.latency.per_prompt_token
+                generation = tokens * server.latency.per_token
+                if simulate:
+                    server._delay(prompt_eval)
+
+                done = {
+                    "model": payload.get("model"),
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": int((load + prompt_eval + generation) * 1e9),
+                    "load_duration": int(load * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prompt_eval * 1e9),
+                    "eval_count": tokens,
+                    "eval_duration": int(generation * 1e9),
+                }
+                done.update(stats)
+
+                if payload.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    pieces = re.findall(r"\S*\s*", content)[:-1] or [content]
+                    per_piece = generation / len(pieces) if simulate else 0.0
+                    for piece in pieces:
+                        server._delay(per_piece)
+                        self._write_chunk({"model": payload.get("model"), "message": {"role": "assistant", "content": piece}, "done": False})
+                    self._write_chunk(dict(done, message={"role": "assistant", "content": ""}))
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    if simulate:
+                        server._delay(generation)
+                    self._send_json(dict(done, message={"role": "assistant", "content": content}))
+
+                with server._lock:
+                    server.intervals.append((start, time.perf_counter()))
+
+            def _send_json(self, response: Dict) -> None:
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, chunk: Dict) -> None:
+                data = (json.dumps(chunk) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
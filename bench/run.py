@@ -0,0 +1,158 @@
+import io
+import re
+import sys
+import json
+import time
+import builtins
+import argparse
+import contextlib
+from collections import defaultdict
+from typing import Dict, List
+from util.metrics import metrics
+from bench.mock_server import Latency, MockOllamaServer, Recordings
+from bench.fake_tools import fake_tools
+from main import MODES, QUERIES, build_agent
+
+_LABELLED = re.compile(r'^(\w+)\{(.*)\}$')
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def observations(snapshot: Dict, name: str) -> Dict[str, Dict]:
+    """Observations of `name` from a metrics snapshot, keyed by their label string."""
+    found = {}
+    for key, stats in snapshot["observations"].items():
+        match = _LABELLED.match(key)
+        if key == name:
+            found[""] = stats
+        elif match and match.group(1) == name:
+            found[match.group(2)] = stats
+    return found
+
+
+def run_query(agent, query: str, server: MockOllamaServer) -> Dict:
+    """Run one query and break its wall time down into LLM wait and framework overhead."""
+    metrics.reset()
+    start = time.perf_counter()
+    agent.execute(query)
+    end = time.perf_counter()
+    snapshot = metrics.snapshot()
+
+    wall = end - start
+    llm_wait = server.busy_time(start, end)
+    stages = defaultdict(float)
+    for labels, stats in observations(snapshot, "stage_seconds").items():
+        stages[labels.split('"')[1]] += stats["sum"]
+
+    return {
+        "query": query,
+        "wall": wall,
+        "llm_calls": sum(stats["count"] for stats in observations(snapshot, "llm_latency_seconds").values()),
+        "prompt_tokens": sum(stats["sum"] for stats in observations(snapshot, "llm_prompt_tokens_per_call").values()),
+        "completion_tokens": sum(stats["sum"] for stats in observations(snapshot, "llm_completion_tokens_per_call").values()),
+        "llm_wait": llm_wait,
+        "overhead": wall - llm_wait,
+        "stages": dict(stages),
+    }
+
+
+def run_mode(mode: str, server: MockOllamaServer, repeat: int = 3, warmup: int = 1, **config) -> List[Dict]:
+    """Run every sample query of a main.py mode `repeat` times, after `warmup` unmeasured passes."""
+    agent = build_agent(mode, base_url=server.url, **config)
+    samples = []
+    for iteration in range(warmup + repeat):
+        for query in QUERIES[mode]:
+            sample = run_query(agent, query, server)
+            if iteration >= warmup:
+                samples.append(sample)
+    return samples
+
+
+def summarize(samples: List[Dict]) -> Dict:
+    def distribution(values):
+        return {"p50": percentile(values, 50), "p90": percentile(values, 90), "p99": percentile(values, 99), "mean": sum(values) / len(values) if values else 0.0}
+
+    stage_values = defaultdict(list)
+    for sample in samples:
+        for stage, seconds in sample["stages"].items():
+            stage_values[stage].append(seconds)
+
+    wall = sum(sample["wall"] for sample in samples)
+    return {
+        "queries": len(samples),
+        "wall_seconds": distribution([sample["wall"] for sample in samples]),
+        "overhead_seconds": distribution([sample["overhead"] for sample in samples]),
+        "overhead_fraction": sum(sample["overhead"] for sample in samples) / wall if wall else 0.0,
+        "llm_calls_per_query": sum(sample["llm_calls"] for sample in samples) / len(samples) if samples else 0.0,
+        "prompt_tokens_per_query": sum(sample["prompt_tokens"] for sample in samples) / len(samples) if samples else 0.0,
+        "completion_tokens_per_query": sum(sample["completion_tokens"] for sample in samples) / len(samples) if samples else 0.0,
+        "stages": {stage: distribution(values) for stage, values in sorted(stage_values.items())},
+    }
+
+
+def print_report(report: Dict) -> None:
+    for mode, summary in report["modes"].items():
+        print(f"\n== {mode}: {summary['queries']} queries, {summary['llm_calls_per_query']:.2f} LLM calls/query, "
+              f"{summary['prompt_tokens_per_query']:.0f} prompt/{summary['completion_tokens_per_query']:.0f} completion tokens/query, "
+              f"{summary['overhead_fraction'] * 100:.1f}% framework overhead")
+        rows = [("query", summary["wall_seconds"]), ("overhead", summary["overhead_seconds"])] + list(summary["stages"].items())
+        print(f"{'stage':<40}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        for name, stats in rows:
+            print(f"{name:<40}" + "".join(f"{stats[q] * 1000:>10.2f}" for q in ("p50", "p90", "p99", "mean")))
+    print(f"\nmock server: {report['server']}")
+
+
+def main(argv: List[str] = None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark the agents against a local mock of Ollama's /api/chat.")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--repeat", type=int, default=3, help="measured passes over each mode's queries")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured passes before measuring")
+    parser.add_argument("--load", type=float, default=0.0, help="seconds to load a model that isn't loaded")
+    parser.add_argument("--ttft", type=float, default=0.02, help="seconds before the first token")
+    parser.add_argument("--per-prompt-token", type=float, default=0.0001, help="seconds per prompt token before the first token")
+    parser.add_argument("--per-token", type=float, default=0.002, help="seconds per generated token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- fraction of random variation of every delay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--words", type=int, default=120, help="length of synthetic answers")
+    parser.add_argument("--cache-slots", type=int, default=4, help="prompts the mock keeps for prefix caching, 0 disables it")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="seconds per fake tool call")
+    parser.add_argument("--recordings", help="JSONL file of recorded responses to replay")
+    parser.add_argument("--record-from", help="URL of a real Ollama to forward to, responses are saved to --recordings")
+    parser.add_argument("--model", help="run every agent on this model instead of the ones models.json sets")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the agents' own output")
+    args = parser.parse_args(argv)
+
+    latency = Latency(args.ttft, args.per_prompt_token, args.per_token, args.jitter, args.seed, args.load)
+    server = MockOllamaServer(latency=latency, recordings=Recordings(args.recordings), upstream=args.record_from, words=args.words, cache_slots=args.cache_slots)
+
+    report = {"config": vars(args), "modes": {}}
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    original_input = builtins.input
+    builtins.input = lambda prompt="": "Florida"  # Canned answer to InteractiveAgent's clarification questions
+    try:
+        with server, fake_tools(args.tool_latency):
+            for mode in args.modes:
+                with output:
+                    samples = run_mode(mode, server, repeat=args.repeat, warmup=args.warmup, model=args.model)
+                report["modes"][mode] = summarize(samples)
+                report["server"] = dict(server.counts, recordings=len(server.recordings))
+    finally:
+        builtins.input = original_input
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    # python -m bench.run --modes plan tool --repeat 5 --json bench.json
+    main(sys.argv[1:])
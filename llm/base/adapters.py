@@ -0,0 +1,159 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class OllamaAdapter:
+    """
+    Translate between the client's requests and responses and a backend's HTTP API.
+
+    Clients build every request in Ollama's /api/chat shape and every response is handed back in
+    that shape, with the message and Ollama's stats fields (prompt_eval_count, eval_count, the
+    *_duration fields in nanoseconds), so the agents don't depend on the backend they talk to.
+    """
+    name = "ollama"
+    chat_endpoint = "/api/chat"
+    health_endpoint = "/api/tags"
+
+    def translate(self, payload: Dict, session=None, backend: str = None) -> Dict:
+        """The request body for a prepared payload, `session` and `backend` are the conversation and URL it is sent to."""
+        return payload
+
+    def parse_response(self, data: Dict) -> Dict:
+        """A non streaming response body in Ollama's shape."""
+        return data
+
+    def parse_line(self, line: str | bytes) -> Optional[Dict]:
+        """One line of a streaming response as an Ollama chunk, None for lines that carry no chunk."""
+        chunk = json.loads(line)
+        if "error" in chunk:
+            raise RuntimeError(f"LLM stream failed: {chunk['error']}")
+        return chunk
+
+
+class OpenAIAdapter(OllamaAdapter):
+    """OpenAI compatible /v1/chat/completions, e.g. vLLM or llama.cpp's server, structured output is sent as json_schema."""
+    name = "openai"
+    chat_endpoint = "/v1/chat/completions"
+    health_endpoint = "/v1/models"
+
+    def translate(self, payload: Dict, session=None, backend: str = None) -> Dict:
+        body = {"model": payload["model"], "messages": payload["messages"], "stream": payload.get("stream", False)}
+        if "temperature" in payload:
+            body["temperature"] = payload["temperature"]
+        if not body["messages"]:
+            # Nothing to prefill, a minimal request still makes the server load the model
+            body["messages"] = [{"role": "user", "content": ""}]
+            body["max_tokens"] = 1
+        options = payload.get("options") or {}
+        if options.get("num_predict"):
+            body["max_tokens"] = options["num_predict"]
+        if payload.get("format") is not None:
+            schema = payload["format"]
+            body["response_format"] = {"type": "json_object"} if schema == "json" else {"type": "json_schema", "json_schema": {"name": "response", "schema": schema}}
+        if body["stream"]:
+            body["stream_options"] = {"include_usage": True}
+        return body
+
+    def parse_response(self, data: Dict) -> Dict:
+        choice = (data.get("choices") or [{}])[0]
+        message = choice.get("message") or {}
+        result = {"model": data.get("model"), "message": {"role": message.get("role", "assistant"), "content": message.get("content") or ""},
+                  "done": True, "done_reason": choice.get("finish_reason")}
+        result.update(self._stats(data))
+        return result
+
+    def parse_line(self, line: str | bytes) -> Optional[Dict]:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            return None  # Server-sent event comments and fields other than data
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+
+        data = json.loads(data)
+        if "error" in data:
+            raise RuntimeError(f"LLM stream failed: {data['error']}")
+        choice = (data.get("choices") or [{}])[0]
+        delta = choice.get("delta") or {}
+        chunk = {"model": data.get("model"), "message": {"role": "assistant", "content": delta.get("content") or ""},
+                 "done": choice.get("finish_reason") is not None or not data.get("choices")}
+        if choice.get("finish_reason") is not None:
+            chunk["done_reason"] = choice["finish_reason"]
+        chunk.update(self._stats(data))
+        return chunk
+
+    def _stats(self, data: Dict) -> Dict:
+        """Ollama's stats fields from OpenAI usage and, when the server sends them, llama.cpp timings."""
+        stats = {}
+        usage = data.get("usage") or {}
+        timings = data.get("timings") or {}
+        if "prompt_n" in timings:
+            stats["prompt_eval_count"] = timings["prompt_n"]  # Only the tokens it had to evaluate, like Ollama
+        elif "prompt_tokens" in usage:
+            stats["prompt_eval_count"] = usage["prompt_tokens"]
+        if "completion_tokens" in usage:
+            stats["eval_count"] = usage["completion_tokens"]
+        elif "predicted_n" in timings:
+            stats["eval_count"] = timings["predicted_n"]
+        if "prompt_ms" in timings:
+            stats["prompt_eval_duration"] = int(timings["prompt_ms"] * 1e6)
+        if "predicted_ms" in timings:
+            stats["eval_duration"] = int(timings["predicted_ms"] * 1e6)
+        if "prompt_ms" in timings and "predicted_ms" in timings:
+            stats["total_duration"] = stats["prompt_eval_duration"] + stats["eval_duration"]
+        return stats
+
+
+class LlamaCppAdapter(OpenAIAdapter):
+    """
+    llama.cpp's server, through its OpenAI compatible endpoint.
+
+    Requests ask the server to keep their prompt in its KV cache (cache_prompt), and every request
+    of a session is pinned to the same slot (id_slot), so a multi-call conversation finds its previous
+    prompt still cached and only the new messages are prefilled. Sessions take the server's `slots`
+    (its --parallel setting) round robin; the least recently used sessions are forgotten after `max_sessions`.
+    """
+    name = "llama.cpp"
+    health_endpoint = "/health"
+
+    def __init__(self, slots: int = 4, max_sessions: int = 1024):
+        self.slots = slots
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # (backend, session) -> slot id
+        self._next_slot = {}  # backend -> slot id for its next new session
+        self._lock = threading.Lock()
+
+    def translate(self, payload: Dict, session=None, backend: str = None) -> Dict:
+        body = super().translate(payload, session, backend)
+        body["cache_prompt"] = True
+        if session is not None and self.slots:
+            body["id_slot"] = self.slot_for(session, backend)
+        return body
+
+    def slot_for(self, session, backend: str = None) -> int:
+        """The slot a session is pinned to on a backend."""
+        key = (backend, session)
+        with self._lock:
+            slot = self._sessions.pop(key, None)
+            if slot is None:
+                slot = self._next_slot.get(backend, 0)
+                self._next_slot[backend] = (slot + 1) % self.slots
+            self._sessions[key] = slot
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return slot
+
+
+ADAPTERS = {"ollama": OllamaAdapter, "openai": OpenAIAdapter, "llama.cpp": LlamaCppAdapter}
+
+
+def get_adapter(adapter: str | OllamaAdapter) -> OllamaAdapter:
+    """An adapter instance from its name ("ollama", "openai" or "llama.cpp") or an adapter itself."""
+    if isinstance(adapter, OllamaAdapter):
+        return adapter
+    if adapter not in ADAPTERS:
+        raise ValueError(f"Unknown LLM backend adapter {adapter}, expected one of {', '.join(ADAPTERS)}")
+    return ADAPTERS[adapter]()
@@ -0,0 +1,209 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Sequence, Tuple
+import httpx
+import requests
+from util.metrics import metrics
+from llm.base.transport import get_transport
+
+DEFAULT_HEALTH_INTERVAL = 10.0  # Seconds between health checks of every backend
+DEFAULT_FAILURE_THRESHOLD = 3  # Consecutive failed requests before a backend is ejected
+DEFAULT_EJECT_SECONDS = 30.0  # How long an ejected backend gets no traffic, unless a health check passes first
+DEFAULT_MAX_SESSIONS = 1024  # Sessions whose backend is remembered, least recently used forgotten first
+HEALTH_TIMEOUT = (2.0, 5.0)
+
+
+@dataclass
+class Backend:
+    url: str
+    outstanding: int = 0
+    failures: int = 0  # Consecutive
+    ejected_until: float = 0.0
+    requests: int = 0
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+def backend_urls(base_url: str | Sequence[str]) -> Tuple[str, ...]:
+    """Backend URLs of a base_url setting: one URL, a comma separated string of URLs or a list of them."""
+    urls = base_url.split(",") if isinstance(base_url, str) else base_url
+    return tuple(url.strip().rstrip("/") for url in urls if url.strip())
+
+
+class BackendPool:
+    """
+    Spread requests over several backends serving the same model.
+
+    Each request goes to the available backend with the fewest requests outstanding (ties go to
+    the least used). A backend is ejected for `eject_seconds` after `failure_threshold` consecutive
+    timeouts or 5xx responses, or right away when it refuses connections. With more than one backend, a
+    daemon thread also checks every backend's `health_endpoint` at startup and every `health_interval`
+    seconds, ejecting the ones that fail and readmitting ejected ones as soon as they pass. If every backend is ejected, requests
+    still go to the one that comes back soonest rather than failing outright.
+
+    Requests of a multi-call session stick to the backend its first request went to while that backend
+    is available, as only that one has the session's previous prompt in its KV cache (and, with
+    llama.cpp, in the slot the session is pinned to). The last `max_sessions` sessions are remembered.
+    """
+    def __init__(self, urls: Sequence[str], health_interval: float = DEFAULT_HEALTH_INTERVAL, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 eject_seconds: float = DEFAULT_EJECT_SECONDS, health_endpoint: str = "/api/tags", max_sessions: int = DEFAULT_MAX_SESSIONS):
+        if not urls:
+            raise ValueError("BackendPool needs at least one backend URL")
+        self.backends = [Backend(url) for url in urls]
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.health_endpoint = health_endpoint
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session -> URL of the backend it sticks to
+        self._lock = threading.Lock()
+        self._checker = None
+        for backend in self.backends:
+            metrics.set("llm_backend_healthy", 1, backend=backend.url)
+
+        if len(self.backends) > 1:
+            self._checker = threading.Thread(target=self._check_forever, name="llm-health-check", daemon=True)
+            self._checker.start()
+
+    @property
+    def urls(self) -> List[str]:
+        return [backend.url for backend in self.backends]
+
+    def acquire(self, url: str = None, session=None) -> Backend:
+        """
+        Pick the backend for a request (or take the one at `url`) and count it as outstanding, release() it when done.
+        A `session` gets the backend of its previous requests while that one is available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [backend for backend in self.backends if backend.available(now)]
+            if session is not None and url is None and len(self.backends) > 1:
+                url = self._sessions.pop(session, None)
+                if url is not None and not any(backend.url == url for backend in candidates):
+                    metrics.incr("llm_backend_session_moves", backend=url)  # Its backend was ejected, the session starts over elsewhere
+                    url = None
+            if url is not None:
+                backend = next(backend for backend in self.backends if backend.url == url)
+            elif candidates:
+                backend = min(candidates, key=lambda b: (b.outstanding, b.requests))
+            else:
+                backend = min(self.backends, key=lambda b: b.ejected_until)
+            if session is not None and len(self.backends) > 1:
+                self._sessions[session] = backend.url
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            backend.outstanding += 1
+            backend.requests += 1
+            metrics.set("llm_backend_outstanding", backend.outstanding, backend=backend.url)
+        return backend
+
+    def release(self, backend: Backend, seconds: float, failed: bool = False, unreachable: bool = False) -> None:
+        """Done with a request, a backend that `failed` too often or is `unreachable` gets ejected."""
+        with self._lock:
+            backend.outstanding -= 1
+            metrics.set("llm_backend_outstanding", backend.outstanding, backend=backend.url)
+            if failed:
+                backend.failures += 1
+                if unreachable or backend.failures >= self.failure_threshold:
+                    self._eject(backend)
+            else:
+                backend.failures = 0
+        metrics.incr("llm_backend_requests", backend=backend.url)
+        if failed:
+            metrics.incr("llm_backend_failures", backend=backend.url)
+        else:
+            metrics.observe("llm_backend_latency_seconds", seconds, backend=backend.url)
+
+    @contextmanager
+    def lease(self, url: str = None, session=None) -> Iterator[str]:
+        """Hold a backend for one request (of `session`), yields its URL. Backend failures raised in the block are counted."""
+        backend = self.acquire(url, session)
+        start = time.perf_counter()
+        failed = unreachable = False
+        try:
+            yield backend.url
+        except Exception as e:
+            failed = is_backend_failure(e)
+            unreachable = isinstance(e, (requests.ConnectionError, httpx.ConnectError)) and not isinstance(e, requests.ReadTimeout)
+            raise
+        finally:
+            self.release(backend, time.perf_counter() - start, failed, unreachable)
+
+    def check(self) -> None:
+        """Run one health check of every backend."""
+        for backend in self.backends:
+            try:
+                response = get_transport(backend.url).session.get(f"{backend.url}{self.health_endpoint}", timeout=HEALTH_TIMEOUT)
+                healthy = response.status_code < 500
+            except requests.RequestException:
+                healthy = False
+
+            with self._lock:
+                if healthy and not backend.available(time.monotonic()):
+                    print(f"LLM backend {backend.url} passed its health check, sending it requests again")
+                    backend.ejected_until = 0.0
+                    backend.failures = 0
+                    metrics.set("llm_backend_healthy", 1, backend=backend.url)
+                elif not healthy and backend.available(time.monotonic()):
+                    self._eject(backend)
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{"backend": backend.url, "available": backend.available(now), "outstanding": backend.outstanding,
+                     "requests": backend.requests, "failures": backend.failures} for backend in self.backends]
+
+    def _eject(self, backend: Backend) -> None:
+        # Called with the lock held
+        if backend.available(time.monotonic()):
+            print(f"Ejecting LLM backend {backend.url} for {self.eject_seconds:.0f} seconds")
+            metrics.incr("llm_backend_ejections", backend=backend.url)
+        backend.ejected_until = time.monotonic() + self.eject_seconds
+        metrics.set("llm_backend_healthy", 0, backend=backend.url)
+
+    def _check_forever(self) -> None:
+        while True:
+            if self.health_interval:
+                self.check()
+            time.sleep(self.health_interval or DEFAULT_HEALTH_INTERVAL)
+
+
+def is_backend_failure(error: Exception) -> bool:
+    """Connection errors, timeouts and 5xx responses count against a backend, other errors are the request's own."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, httpx.TransportError))
+
+
+_pools: Dict[Tuple[str, ...], BackendPool] = {}
+_pools_lock = threading.Lock()
+
+
+def configure_backend_pool(base_url: str | Sequence[str], health_interval: float = DEFAULT_HEALTH_INTERVAL, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                           eject_seconds: float = DEFAULT_EJECT_SECONDS, health_endpoint: str = "/api/tags") -> BackendPool:
+    """Set the health check and ejection settings used for a set of backends, clients sharing the pool pick up the change."""
+    pool = get_backend_pool(base_url)
+    pool.health_interval = health_interval
+    pool.failure_threshold = failure_threshold
+    pool.eject_seconds = eject_seconds
+    pool.health_endpoint = health_endpoint
+    return pool
+
+
+def get_backend_pool(base_url: str | Sequence[str]) -> BackendPool:
+    """
+    Get the pool shared by every client of the same backends, creating one with default settings if needed.
+    Sharing it makes the outstanding request counts cover the whole process.
+    """
+    urls = backend_urls(base_url)
+    with _pools_lock:
+        pool = _pools.get(urls)
+        if pool is None:
+            pool = _pools[urls] = BackendPool(urls)
+        return pool
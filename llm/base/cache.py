@@ -0,0 +1,150 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+from util.metrics import metrics
+
+
+class ResponseCache:
+    """
+    Content addressed cache of LLM responses, keyed by a hash of the complete request payload.
+
+    Entries live in an in-memory LRU tier and, when `path` is given, in a SQLite file that any
+    number of processes can share. Both tiers evict least recently used entries once they go over
+    their size budget, and entries older than `ttl` seconds are ignored.
+    Only deterministic requests (temperature 0) should be cached.
+    """
+    def __init__(self, path: str = None, ttl: float = None, memory_max_bytes: int = 64 * 1024 * 1024, disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (created, serialized response)
+        self._memory_bytes = 0
+        self._hits = {"memory": 0, "disk": 0}
+        self._misses = 0
+        self._db = self._open_db(path) if path else None
+
+    @staticmethod
+    def key_for(payload: Dict) -> str:
+        """Hash everything that influences the generation, streaming or not makes no difference."""
+        material = {k: v for k, v in payload.items() if k != "stream"}
+        return hashlib.sha256(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get a cached response, or None on a miss."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if self._fresh(created, now):
+                    self._memory.move_to_end(key)
+                    self._hit("memory")
+                    return json.loads(value)
+                self._drop(key)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT created, value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._fresh(row[0], now):
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self._hit("disk")
+                    return json.loads(row[1])
+
+            self._misses += 1
+        metrics.incr("llm_cache_misses")
+        return None
+
+    def set(self, key: str, response: Dict) -> None:
+        """Store a response in every tier."""
+        now = time.time()
+        value = json.dumps(response, ensure_ascii=False)
+
+        with self._lock:
+            self._remember(key, now, value)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), now, now)
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters and the current size of each tier."""
+        with self._lock:
+            memory_hits, disk_hits, misses = self._hits["memory"], self._hits["disk"], self._misses
+            lookups = memory_hits + disk_hits + misses
+            stats = {
+                "memory_hits": memory_hits,
+                "disk_hits": disk_hits,
+                "misses": misses,
+                "hit_rate": (memory_hits + disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+            if self._db is not None:
+                entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                stats.update({"disk_entries": entries, "disk_bytes": size})
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _hit(self, tier: str) -> None:
+        self._hits[tier] += 1
+        metrics.incr("llm_cache_hits", tier=tier)
+
+    def _fresh(self, created: float, now: float) -> bool:
+        return self.ttl is None or now - created <= self.ttl
+
+    def _remember(self, key: str, created: float, value: str) -> None:
+        self._drop(key)
+        self._memory[key] = (created, value)
+        self._memory_bytes += len(value)
+
+        # Evict least recently used entries, always keeping the newest one
+        while self._memory_bytes > self.memory_max_bytes and len(self._memory) > 1:
+            self._drop(next(iter(self._memory)))
+
+    def _drop(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    def _evict_disk(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.disk_max_bytes:
+                break
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")  # Lets several processes read while one writes
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        db.commit()
+        return db
@@ -1,34 +1,247 @@
-import requests
 import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, Iterator
+from llm.base.transport import get_async_transport, get_transport
+from util.metrics import metrics, TOKEN_BUCKETS
+from util.tracing import tracer
+from llm.base.tokens import token_estimator, fit_to_budget
+from llm.base.balancer import get_backend_pool
+from llm.base.adapters import OllamaAdapter, get_adapter
+
+# How long the backend keeps a model loaded after a request (Ollama's own default is 5 minutes)
+DEFAULT_KEEP_ALIVE = "30m"
+# A load_duration above this means the request paid for loading the model
+COLD_START_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class SystemPrompt:
+    """A rendered system message, kept with its serialized JSON bytes so it can be spliced into request bodies."""
+    message: Dict[str, str]
+    data: bytes
+    digest: str
+
 
 class BaseLLMClient:
-    def __init__(self, base_url, model, temperature=0.0, stream = True, system_prompt_func = None):
-        self.base_url = base_url
+    def __init__(self, base_url, model, temperature=0.0, stream = True, system_prompt_func = None, cache = None, response_format = None, token_budget = None, name = None, keep_alive = DEFAULT_KEEP_ALIVE, adapter = "ollama"):
+        self.adapter = get_adapter(adapter)  # The backend's HTTP API ("ollama", "openai", "llama.cpp"), see llm.base.adapters
+        self.backends = get_backend_pool(base_url)  # One or more backends serving the model, see llm.base.balancer
+        self.backends.health_endpoint = self.adapter.health_endpoint
+        self.base_url = self.backends.urls[0]
         self.model = model
         self.temperature = temperature
         self.stream = stream
         self.create_system_prompt = system_prompt_func or default_system_prompt
+        self.cache = cache  # Optional ResponseCache, see llm.base.cache
+        self.response_format = response_format  # Optional JSON schema the backend must constrain its output to
+        self.token_budget = token_budget  # Optional max estimated prompt tokens, longer requests are trimmed
+        self.name = name or type(self).__name__  # Who is calling, for metrics
+        self.keep_alive = keep_alive  # Sent with every request (e.g. "30m", seconds, -1 for forever), None leaves the backend default
+        self._system_prompt = None
+        self._sessions = OrderedDict()  # session -> message digests of its last request, see check_prefix
+        self._sessions_lock = threading.Lock()
         
+    def system_prompt(self) -> SystemPrompt:
+        """Render the system prompt once and reuse it until invalidate_system_prompt() is called."""
+        system_prompt = self._system_prompt
+        if system_prompt is None:
+            message = {"role": "system", "content": self.create_system_prompt()}
+            data = json.dumps(message).encode("utf-8")
+            system_prompt = self._system_prompt = SystemPrompt(message, data, hashlib.sha256(data).hexdigest())
+        return system_prompt
 
-    def send_request(self, endpoint, payload, headers=None):
-        url = f"{self.base_url}{endpoint}"
-        headers = headers or {'Content-Type': 'application/json', 'Accept': 'application/json'}
-        payload['model'] = self.model  # Automatically include model
+    def invalidate_system_prompt(self) -> None:
+        """Drop the rendered system prompt, call it whenever something the prompt is built from changes."""
+        self._system_prompt = None
+
+    def prepare_payload(self, payload):
+        """Complete the payload with the client settings and the system prompt."""
+        payload = dict(payload)
+        payload.setdefault('model', self.model)  # Automatically include model, unless the caller picked one for this call
         payload['temperature'] = self.temperature  # Automatically include temperature
-        payload['stream'] = self.stream  # Automatically include temperature
+        payload.setdefault('stream', self.stream)  # Automatically include stream, unless the caller asked for it
+        if self.keep_alive is not None:
+            payload['keep_alive'] = self.keep_alive  # Keep the model loaded between requests
+        if self.response_format is not None:
+            payload['format'] = self.response_format  # Structured output, the backend only generates valid JSON for the schema
         
-        system_prompt = {"role": "system", "content": self.create_system_prompt()}
-        payload['messages'].insert(0,system_prompt)   # Automatically include system message at the top
+        system_prompt = self.system_prompt().message
+        messages = [system_prompt] + payload['messages']   # Automatically include system message at the top
+
+        if self.token_budget:
+            messages, trimmed = fit_to_budget(messages, self.token_budget, self.count_tokens, self.count_text_tokens)
+            if trimmed:
+                print(f"Trimmed {trimmed} tokens from the {self.name} request to fit its {self.token_budget} token budget")
+                metrics.incr("llm_trimmed_requests", agent=self.name)
+                metrics.incr("llm_trimmed_tokens", trimmed, agent=self.name)
+
+        metrics.observe("llm_request_tokens", self.count_tokens(messages, payload['model']), buckets=TOKEN_BUCKETS, agent=self.name, model=payload['model'])
+        payload['messages'] = messages
+        return payload
+
+    def count_tokens(self, messages, model=None) -> int:
+        """Estimated prompt tokens of the messages, calibrated for this client's model (or `model`)."""
+        return token_estimator.count(model or self.model, messages)
+
+    def count_text_tokens(self, text) -> int:
+        return token_estimator.count_text(self.model, text)
+
+    def account_tokens(self, payload, response, span=None) -> None:
+        """
+        Compare the prompt size the backend reported for a prepared payload with the estimate:
+        calibrates the estimator, and as backends only count the prompt tokens they had to process,
+        the difference estimates how much of the prompt came from the KV prefix cache.
+        """
+        evaluated = response.get("prompt_eval_count")
+        if evaluated is None:
+            return
+
+        model = payload['model']
+        token_estimator.calibrate(model, payload['messages'], evaluated)
+        total = self.count_tokens(payload['messages'], model)
+        hit = min(1.0, max(0.0, 1 - evaluated / total)) if total else 0.0
+        metrics.observe("llm_prefix_cache_hit_ratio", hit, buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0), agent=self.name, model=model)
+        metrics.incr("llm_prompt_tokens_reused", max(0, total - evaluated), agent=self.name, model=model)
+        if span is not None:
+            span.set(prompt_tokens_estimate=total, prefix_cache_hit=round(hit, 3))
+
+    def check_prefix(self, session, messages, max_sessions=256) -> bool:
+        """
+        Check that a request of a multi-call session only appends to the previous request of that
+        session, with every earlier message byte-identical, so the backend can reuse its KV cache
+        for the whole previous prompt. Returns False (and counts a prefix break) when it doesn't.
+        """
+        system_prompt = self.system_prompt()
+        digests = [system_prompt.digest if message is system_prompt.message else hashlib.sha256(json.dumps(message).encode("utf-8")).hexdigest()
+                   for message in messages]
+
+        with self._sessions_lock:
+            previous = self._sessions.pop(session, None)
+            self._sessions[session] = digests
+            while len(self._sessions) > max_sessions:
+                self._sessions.popitem(last=False)
+
+        if previous is None or digests[:len(previous)] == previous:
+            return True
+
+        changed = next(index for index, digest in enumerate(previous) if index >= len(digests) or digests[index] != digest)
+        print(f"Prefix break in {self.name} session {session}: message {changed} changed, the backend has to prefill it again")
+        metrics.incr("llm_prefix_breaks", agent=self.name)
+        return False
+
+    def build_request(self, endpoint, payload, headers=None, backend=None, session=None):
+        """Return the url, headers and body to send for a prepared payload, in the adapter's API."""
+        url = f"{backend or self.base_url}{endpoint}"
+        headers = headers or {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        return url, headers, self.serialize_payload(self.adapter.translate(payload, session, backend or self.base_url))
+
+    def serialize_payload(self, payload) -> bytes:
+        """
+        Serialize a prepared payload, splicing in the pre-serialized system message
+        so only the conversation and settings are encoded on every request.
+        """
+        system_prompt = self.system_prompt()
+        messages = payload['messages']
+        if not messages or messages[0] is not system_prompt.message:
+            return json.dumps(payload).encode("utf-8")
+
+        rest = {k: v for k, v in payload.items() if k != 'messages'}
+        parts = [b'{"messages": [', system_prompt.data]
+        if len(messages) > 1:
+            parts += [b', ', json.dumps(messages[1:]).encode("utf-8")[1:-1]]
+        parts.append(b']')
+        if rest:
+            parts += [b', ', json.dumps(rest).encode("utf-8")[1:]]
+        else:
+            parts.append(b'}')
+        return b''.join(parts)
+
+    def send_request(self, endpoint, payload, headers=None):
+        return self.send_payload(endpoint, self.prepare_payload(payload), headers)
+
+    def send_payload(self, endpoint, payload, headers=None, backend=None, session=None):
+        """Send an already prepared payload, to `backend` (a URL leased from self.backends) or the first backend."""
+        backend = backend or self.base_url
+        url, headers, data = self.build_request(endpoint, payload, headers, backend, session)
         
-        # Send request to LLM
-        response = requests.post(
+        # Send request to LLM over the pooled connection
+        response = get_transport(backend).post(
             url,
             headers=headers,
-            data=json.dumps(payload)
+            data=data,
+            stream=payload['stream']
         )
 
         return response
 
+    def warm_up(self, prefill=True, endpoint=None, model=None) -> float:
+        """
+        Load the model (or `model`) into backend memory ahead of the first real request, returns the seconds it took.
+        With `prefill` the system prompt is also evaluated, so the backend has it in its KV prefix cache.
+        """
+        model = model or self.model
+        with tracer.span("llm.warm_up", kind="llm", agent=self.name, model=model) as span:
+            start = time.perf_counter()
+            payload = {"model": model, "messages": [], "stream": False}
+            if prefill:
+                payload["messages"] = [self.system_prompt().message]
+                payload["options"] = {"num_predict": 1}
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
+
+            endpoint = endpoint or self.adapter.chat_endpoint
+            warmed = 0
+            for url in self.backends.urls:  # Every backend has to load the model
+                try:
+                    with self.backends.lease(url) as backend:
+                        response = self.send_payload(endpoint, payload, backend=backend)
+                        response.raise_for_status()
+                        data = self.adapter.parse_response(response.json())
+                        record_usage(model, data, span)
+                        if prefill and data.get("prompt_eval_count"):
+                            # A cold system prompt only request, the best first sample to calibrate the token estimate on
+                            token_estimator.calibrate(model, payload["messages"], data["prompt_eval_count"])
+                        warmed += 1
+                except Exception as e:
+                    if len(self.backends.urls) == 1 or (url == self.backends.urls[-1] and not warmed):
+                        raise
+                    print(f"Could not warm up {model} on {url}: {str(e)}")
+
+            elapsed = time.perf_counter() - start
+            metrics.observe("llm_warm_up_seconds", elapsed, model=model)
+            return elapsed
+
+    def cached_response(self, payload):
+        """Look a prepared payload up in the response cache, returns (cache key, response or None)."""
+        if self.cache is None:
+            return None, None
+        # The system prompt is represented by its digest, no need to hash kilobytes of identical text again
+        material = dict(payload, messages=payload['messages'][1:], system=self.system_prompt().digest)
+        key = self.cache.key_for(material)
+        return key, self.cache.get(key)
+
+    def cache_response(self, key, response):
+        if key is not None:
+            self.cache.set(key, response)
+
+
+class AsyncLLMClient(BaseLLMClient):
+    """BaseLLMClient that can also send requests from an asyncio event loop without blocking it."""
+
+    def asend_request(self, endpoint, payload, headers=None):
+        """Send request to LLM, returns an async context manager yielding the not yet read response."""
+        return self.asend_payload(endpoint, self.prepare_payload(payload), headers)
+
+    def asend_payload(self, endpoint, payload, headers=None, backend=None, session=None):
+        """Send an already prepared payload, see asend_request."""
+        backend = backend or self.base_url
+        url, headers, data = self.build_request(endpoint, payload, headers, backend, session)
+        return get_async_transport(backend).post(url, headers=headers, data=data)
+
     
 def default_system_prompt() -> str:
         """Create the default system prompt for the assistant"""
@@ -53,13 +266,257 @@ Your goal is to enhance the user's experience by being a reliable and efficient
 
 
 class ChatClient:
-    def __init__(self, chat_handler, endpoint = "/api/chat"):
+    def __init__(self, chat_handler, endpoint = None):
         self.chat_handler  = chat_handler
-        self.endpoint  = endpoint
+        self.endpoint  = endpoint or chat_handler.adapter.chat_endpoint
         self.client = chat_handler
 
 
-    def chat(self, message):
-        payload = {"messages": message}
-        response = self.client.send_request(self.endpoint, payload)
-        return response
\ No newline at end of file
+    def chat(self, message, on_token: Callable[[str], None] = None, session = None, model = None) -> Dict:
+        """
+        Send the conversation and return the complete response, from the client's model or `model`.
+        When streaming, partial content is handed to `on_token` as soon as it arrives.
+        Calls sharing a `session` are checked to only ever append to the conversation, see check_prefix.
+        """
+        stream = bool(self.client.stream or on_token)
+        model = model or self.client.model
+        with tracer.span("llm.chat", kind="llm", agent=self.client.name, model=model, stream=stream) as span:
+            payload = self.client.prepare_payload({"messages": message, "stream": stream, "model": model})
+            if session is not None:
+                self.client.check_prefix(session, payload['messages'])
+
+            key, result = self.client.cached_response(payload)
+            if result is not None:
+                span.set(cached=True)
+                if on_token:
+                    on_token(chunk_content(result))
+                return result
+
+            if not stream:
+                start = time.perf_counter()
+                with self.client.backends.lease(session=session) as backend:
+                    response = self.client.send_payload(self.endpoint, payload, backend=backend, session=session)
+                    response.raise_for_status()
+                    result = self.client.adapter.parse_response(response.json())
+                record_call(model, start, None)
+            else:
+                result = merge_chunks(self._chunks(payload, session), on_token)
+
+            record_usage(model, result, span)
+            self.client.account_tokens(payload, result, span)
+            self.client.cache_response(key, result)
+            return result
+
+    def stream_chat(self, message, session = None, model = None) -> Iterator[str]:
+        """Yield the response content piece by piece as the backend generates it."""
+        model = model or self.client.model
+        # Not made current, a generator's context doesn't outlive each yield
+        span = tracer.start("llm.chat", kind="llm", agent=self.client.name, model=model, stream=True)
+        try:
+            payload = self.client.prepare_payload({"messages": message, "stream": True, "model": model})
+            if session is not None:
+                self.client.check_prefix(session, payload['messages'])
+
+            key, result = self.client.cached_response(payload)
+            if result is not None:
+                span.set(cached=True)
+                yield chunk_content(result)
+                return
+
+            chunks = []
+            for chunk in self._chunks(payload, session):
+                chunks.append(chunk)
+                delta = chunk_content(chunk)
+                if delta:
+                    yield delta
+
+            result = merge_chunks(chunks)
+            record_usage(model, result, span)
+            self.client.account_tokens(payload, result, span)
+            self.client.cache_response(key, result)
+        finally:
+            tracer.finish(span)
+
+    def _chunks(self, payload, session = None) -> Iterator[Dict]:
+        """Send a prepared streaming request and yield each NDJSON chunk of the response as it arrives."""
+        start = time.perf_counter()
+        first_token = None
+
+        with self.client.backends.lease(session=session) as backend:
+            response = self.client.send_payload(self.endpoint, payload, backend=backend, session=session)
+            with response:  # Hands the connection back to the pool, even if the caller stops early
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+
+                    chunk = self.client.adapter.parse_line(line)
+                    if chunk is None:
+                        continue
+                    if first_token is None and chunk_content(chunk):
+                        first_token = time.perf_counter()
+                    yield chunk
+
+        record_call(payload['model'], start, first_token)
+
+
+class AsyncChatClient:
+    """asyncio counterpart of ChatClient, the chat handler must be an AsyncLLMClient."""
+
+    def __init__(self, chat_handler, endpoint = None):
+        self.chat_handler  = chat_handler
+        self.endpoint  = endpoint or chat_handler.adapter.chat_endpoint
+        self.client = chat_handler
+
+    async def chat(self, message, on_token: Callable[[str], None] = None, session = None, model = None) -> Dict:
+        """
+        Send the conversation and return the complete response, from the client's model or `model`.
+        When streaming, partial content is handed to `on_token` as soon as it arrives.
+        Calls sharing a `session` are checked to only ever append to the conversation, see check_prefix.
+        """
+        stream = bool(self.client.stream or on_token)
+        model = model or self.client.model
+        with tracer.span("llm.chat", kind="llm", agent=self.client.name, model=model, stream=stream) as span:
+            payload = self.client.prepare_payload({"messages": message, "stream": stream, "model": model})
+            if session is not None:
+                self.client.check_prefix(session, payload['messages'])
+
+            key, result = self.client.cached_response(payload)
+            if result is not None:
+                span.set(cached=True)
+                if on_token:
+                    on_token(chunk_content(result))
+                return result
+
+            if not stream:
+                start = time.perf_counter()
+                with self.client.backends.lease(session=session) as backend:
+                    async with self.client.asend_payload(self.endpoint, payload, backend=backend, session=session) as response:
+                        response.raise_for_status()
+                        result = self.client.adapter.parse_response(json.loads(await response.aread()))
+                record_call(model, start, None)
+            else:
+                chunks = []
+                async for chunk in self._chunks(payload, session):
+                    chunks.append(chunk)
+                    if on_token and chunk_content(chunk):
+                        on_token(chunk_content(chunk))
+                result = merge_chunks(chunks)
+
+            record_usage(model, result, span)
+            self.client.account_tokens(payload, result, span)
+            self.client.cache_response(key, result)
+            return result
+
+    async def stream_chat(self, message, session = None, model = None) -> AsyncIterator[str]:
+        """Yield the response content piece by piece as the backend generates it."""
+        model = model or self.client.model
+        # Not made current, a generator's context doesn't outlive each yield
+        span = tracer.start("llm.chat", kind="llm", agent=self.client.name, model=model, stream=True)
+        try:
+            payload = self.client.prepare_payload({"messages": message, "stream": True, "model": model})
+            if session is not None:
+                self.client.check_prefix(session, payload['messages'])
+
+            key, result = self.client.cached_response(payload)
+            if result is not None:
+                span.set(cached=True)
+                yield chunk_content(result)
+                return
+
+            chunks = []
+            async for chunk in self._chunks(payload, session):
+                chunks.append(chunk)
+                delta = chunk_content(chunk)
+                if delta:
+                    yield delta
+
+            result = merge_chunks(chunks)
+            record_usage(model, result, span)
+            self.client.account_tokens(payload, result, span)
+            self.client.cache_response(key, result)
+        finally:
+            tracer.finish(span)
+
+    async def _chunks(self, payload, session = None) -> AsyncIterator[Dict]:
+        """Send a prepared streaming request and yield each NDJSON chunk of the response as it arrives."""
+        start = time.perf_counter()
+        first_token = None
+
+        with self.client.backends.lease(session=session) as backend:
+            async with self.client.asend_payload(self.endpoint, payload, backend=backend, session=session) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+
+                    chunk = self.client.adapter.parse_line(line)
+                    if chunk is None:
+                        continue
+                    if first_token is None and chunk_content(chunk):
+                        first_token = time.perf_counter()
+                    yield chunk
+
+        record_call(payload['model'], start, first_token)
+
+
+def parse_chunk(line: str | bytes) -> Dict:
+    """Parse one line of an Ollama NDJSON chat stream."""
+    return OllamaAdapter().parse_line(line)
+
+
+def chunk_content(chunk: Dict) -> str:
+    return chunk.get("message", {}).get("content", "")
+
+
+def merge_chunks(chunks, on_token: Callable[[str], None] = None) -> Dict:
+    """
+    Stitch streamed chunks back into a single response, the last chunk carries the backend stats.
+    Partial content is handed to `on_token` while the chunks are consumed.
+    """
+    content = []
+    result = {}
+    for chunk in chunks:
+        delta = chunk_content(chunk)
+        if delta:
+            content.append(delta)
+            if on_token:
+                on_token(delta)
+        result = chunk
+
+    result = dict(result)
+    result["message"] = {"role": "assistant", "content": "".join(content)}
+    return result
+
+
+def record_usage(model: str, response: Dict, span=None) -> None:
+    """
+    Record the token counts and backend timings Ollama reports on a final response
+    (durations come in nanoseconds), on the span and as metrics.
+    """
+    usage = {name: response[name] for name in ("prompt_eval_count", "eval_count") if name in response}
+    for name in ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration"):
+        if name in response:
+            usage[name.replace("_duration", "_seconds")] = response[name] / 1e9
+    if span is not None:
+        span.set(**usage)
+
+    if "prompt_eval_count" in usage:
+        metrics.incr("llm_prompt_tokens", usage["prompt_eval_count"], model=model)
+        metrics.observe("llm_prompt_tokens_per_call", usage["prompt_eval_count"], buckets=TOKEN_BUCKETS, model=model)
+    if "eval_count" in usage:
+        metrics.incr("llm_completion_tokens", usage["eval_count"], model=model)
+        metrics.observe("llm_completion_tokens_per_call", usage["eval_count"], buckets=TOKEN_BUCKETS, model=model)
+    for name in ("load_seconds", "prompt_eval_seconds", "eval_seconds"):
+        if name in usage:
+            metrics.observe(f"llm_{name}", usage[name], model=model)
+    if usage.get("load_seconds", 0) >= COLD_START_SECONDS:
+        metrics.incr("llm_cold_starts", model=model)
+
+
+def record_call(model: str, start: float, first_token: float | None) -> None:
+    """Record time-to-first-token (streaming only) and total latency of a call."""
+    end = time.perf_counter()
+    if first_token is not None:
+        metrics.observe("llm_ttft_seconds", first_token - start, model=model)
+    metrics.observe("llm_latency_seconds", end - start, model=model)
@@ -0,0 +1,70 @@
+import os
+import json
+import threading
+from typing import Dict, List
+
+DEFAULT_MODEL = "qwen2.5:32b"
+# models.json at the top of the repository, or the file named by $AGENT_MODELS_CONFIG
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "models.json")
+
+
+class ModelConfig:
+    """
+    Which model each agent, and each step of an agent, runs on, e.g. a small model for routing and
+    outlining and a large one for writing prose. Read from a JSON file:
+
+        {
+          "default": "qwen2.5:32b",
+          "agents": {
+            "PlannerAgent": "qwen2.5:3b",
+            "ToolAgent.replan": "qwen2.5:7b"
+          }
+        }
+
+    "Agent.step" entries apply to one step of an agent, "Agent" entries to all its other steps,
+    everything else runs on the default.
+    """
+    def __init__(self, default: str = DEFAULT_MODEL, agents: Dict[str, str] = None):
+        self.default = default
+        self.agents = dict(agents or {})
+
+    @classmethod
+    def load(cls, path: str) -> "ModelConfig":
+        with open(path, encoding="utf-8") as file:
+            config = json.load(file)
+        return cls(config.get("default", DEFAULT_MODEL), config.get("agents"))
+
+    def model_for(self, agent: str, step: str = None) -> str:
+        if step is not None and f"{agent}.{step}" in self.agents:
+            return self.agents[f"{agent}.{step}"]
+        return self.agents.get(agent, self.default)
+
+    def models_for(self, agent: str) -> List[str]:
+        """Every model an agent can run on, its own first."""
+        models = [self.model_for(agent)]
+        for key, model in self.agents.items():
+            if key.startswith(f"{agent}.") and model not in models:
+                models.append(model)
+        return models
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def model_config() -> ModelConfig:
+    """The process-wide model config, loaded from the config file on first use (defaults when there is none)."""
+    global _config
+    with _config_lock:
+        if _config is None:
+            path = os.environ.get("AGENT_MODELS_CONFIG", DEFAULT_CONFIG_PATH)
+            _config = ModelConfig.load(path) if os.path.exists(path) else ModelConfig()
+        return _config
+
+
+def set_model_config(config: ModelConfig | str) -> ModelConfig:
+    """Replace the model config with another one or one loaded from a file, agents built afterwards use it."""
+    global _config
+    with _config_lock:
+        _config = ModelConfig.load(config) if isinstance(config, str) else config
+        return _config
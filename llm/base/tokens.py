@@ -0,0 +1,99 @@
+import math
+import threading
+from typing import Dict, List, Tuple
+
+CHARS_PER_TOKEN = 4.0
+MESSAGE_OVERHEAD = 4  # Role and template tokens the chat template adds around every message
+TRIM_MARKER = "\n...[trimmed]...\n"
+TRIM_MARKER_TOKENS = 8
+MIN_TRIM_CHARS = 64
+
+
+class TokenEstimator:
+    """
+    Fast character based token estimate, calibrated against the prompt_eval_count the backend reports.
+
+    The raw estimate (characters / 4 plus a per-message overhead) is scaled by a per-model ratio,
+    a moving average of actual / raw. Reports well below the estimate are taken as prefix cache
+    hits (the backend only counts the tokens it had to process) and are not used to calibrate,
+    a model's first report included: until it has a ratio it is compared with the uncalibrated estimate.
+    """
+    def __init__(self, smoothing: float = 0.2, cache_hit_threshold: float = 0.7):
+        self.smoothing = smoothing
+        self.cache_hit_threshold = cache_hit_threshold
+        self._ratios: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def raw(self, messages: List[Dict[str, str]]) -> float:
+        return sum(len(message.get("content") or "") / CHARS_PER_TOKEN + MESSAGE_OVERHEAD for message in messages)
+
+    def ratio(self, model: str) -> float:
+        with self._lock:
+            return self._ratios.get(model, 1.0)
+
+    def count(self, model: str, messages: List[Dict[str, str]]) -> int:
+        """Estimated prompt tokens of a conversation."""
+        return math.ceil(self.raw(messages) * self.ratio(model))
+
+    def count_text(self, model: str, text: str) -> int:
+        return math.ceil(len(text) / CHARS_PER_TOKEN * self.ratio(model))
+
+    def calibrate(self, model: str, messages: List[Dict[str, str]], prompt_eval_count: int) -> bool:
+        """Fold one backend report into the model's ratio, returns False when it was skipped as a cache hit."""
+        raw = self.raw(messages)
+        if not raw or not prompt_eval_count:
+            return False
+
+        with self._lock:
+            ratio = self._ratios.get(model)
+            sample = prompt_eval_count / raw
+            if sample < (1.0 if ratio is None else ratio) * self.cache_hit_threshold:
+                return False
+            self._ratios[model] = sample if ratio is None else ratio + self.smoothing * (sample - ratio)
+            return True
+
+
+# Shared by every client, calibration for a model carries over between agents
+token_estimator = TokenEstimator()
+
+
+def fit_to_budget(messages: List[Dict[str, str]], budget: int, count, count_text) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Deterministically shrink a conversation to `budget` estimated tokens.
+    The system message, the first user message and the latest message are always kept; older turns
+    in between are dropped oldest first, then the longest remaining message is cut in the middle.
+    Returns the new messages and the number of tokens removed.
+    """
+    before = count(messages)
+    if before <= budget:
+        return messages, 0
+
+    messages = list(messages)
+    protected = {0, len(messages) - 1}
+    first_user = next((index for index, message in enumerate(messages) if message["role"] == "user"), None)
+    if first_user is not None:
+        protected.add(first_user)
+
+    # Drop the oldest turns between the protected messages
+    dropped = set()
+    for index in range(len(messages)):
+        if count([message for i, message in enumerate(messages) if i not in dropped]) <= budget:
+            break
+        if index not in protected:
+            dropped.add(index)
+    messages = [message for index, message in enumerate(messages) if index not in dropped]
+
+    # Still too long, cut the longest message down in the middle, keeping its start and end
+    while count(messages) > budget:
+        candidates = [index for index, message in enumerate(messages) if message["role"] != "system" and len(message["content"]) > MIN_TRIM_CHARS]
+        if not candidates:
+            break  # Only the system prompt is left to blame
+        index = max(candidates, key=lambda i: (len(messages[i]["content"]), -i))
+        content = messages[index]["content"]
+        excess = count(messages) - budget + TRIM_MARKER_TOKENS
+        keep = max(0, len(content) - math.ceil(excess * len(content) / max(1, count_text(content))))
+        head, tail = content[:keep - keep // 2], content[len(content) - keep // 2:] if keep // 2 else ""
+        messages[index] = dict(messages[index], content=f"{head}{TRIM_MARKER}{tail}")
+
+    return messages, before - count(messages)
+
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import weakref
+import httpx
+import requests
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from util.metrics import metrics
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5.0, 600.0)  # (connect, read) in seconds, a 32b model can take minutes to answer
+
+
+# Whether the connection the current thread last took from a pool was already open
+_checkout = threading.local()
+
+
+class _ReuseTrackingPool:
+    """Connection pool mixin that records, per checkout, whether the connection handed out is a kept-alive one."""
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        # Kept-alive connections still hold their socket, new (or dropped and reset) ones connect on first use
+        _checkout.reused = conn.sock is not None
+        return conn
+
+
+class _HTTPConnectionPool(_ReuseTrackingPool, HTTPConnectionPool):
+    pass
+
+
+class _HTTPSConnectionPool(_ReuseTrackingPool, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that counts keep-alive reuse of a pooled connection (hit) versus opening a new one (miss).
+    """
+    def __init__(self, backend: str, **kwargs):
+        self.backend = backend
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPConnectionPool, "https": _HTTPSConnectionPool}
+
+    def send(self, request, **kwargs):
+        _checkout.reused = None
+        response = super().send(request, **kwargs)
+
+        # Decided from this request's own connection, other threads opening sockets on the pool don't affect it
+        if _checkout.reused is not None:
+            metrics.incr("http_pool_hits" if _checkout.reused else "http_pool_misses", backend=self.backend)
+
+        return response
+
+
+class HTTPTransport:
+    """
+    Keep-alive HTTP session shared by every LLM client talking to the same backend.
+    """
+    def __init__(self, base_url: str, pool_size: int = DEFAULT_POOL_SIZE, timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.configure(pool_size, timeout)
+
+    def configure(self, pool_size: int, timeout: Tuple[float, float]) -> None:
+        """(Re)build the connection pool, clients holding this transport pick up the change."""
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # pool_block makes callers wait for a free connection instead of opening throw-away ones
+        adapter = PooledHTTPAdapter(self.base_url, pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, url: str, data=None, headers: Dict[str, str] = None, stream: bool = False) -> requests.Response:
+        return self.session.post(url, data=data, headers=headers, stream=stream, timeout=self.timeout)
+
+    def stats(self) -> Dict:
+        """Get pool configuration and hit/miss counters for this backend."""
+        hits = metrics.value("http_pool_hits", backend=self.base_url)
+        misses = metrics.value("http_pool_misses", backend=self.base_url)
+        return {
+            "backend": self.base_url,
+            "pool_size": self.pool_size,
+            "timeout": self.timeout,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class AsyncHTTPTransport:
+    """
+    asyncio counterpart of HTTPTransport, one keep-alive httpx pool per backend and event loop.
+    """
+    def __init__(self, base_url: str, pool_size: int = DEFAULT_POOL_SIZE, timeout: Tuple[float, float] = DEFAULT_TIMEOUT):
+        connect_timeout, read_timeout = timeout
+        self.base_url = base_url
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None)  # Wait for a free connection
+        )
+
+    @asynccontextmanager
+    async def post(self, url: str, data=None, headers: Dict[str, str] = None) -> AsyncIterator[httpx.Response]:
+        """Send a POST and yield the response before its body is read, so it can be streamed."""
+        opened = False
+
+        async def trace(event_name, info):
+            nonlocal opened
+            if event_name == "connection.connect_tcp.complete":
+                opened = True
+
+        async with self.client.stream("POST", url, content=data, headers=headers, extensions={"trace": trace}) as response:
+            metrics.incr("http_pool_misses" if opened else "http_pool_hits", backend=self.base_url)
+            yield response
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_transports: Dict[str, HTTPTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def configure_transport(base_url: str, pool_size: int = DEFAULT_POOL_SIZE, timeout: Tuple[float, float] = DEFAULT_TIMEOUT) -> HTTPTransport:
+    """Set the pool size and timeouts used for a backend."""
+    transport = get_transport(base_url)
+    transport.configure(pool_size, timeout)
+    return transport
+
+
+def get_transport(base_url: str) -> HTTPTransport:
+    """Get the shared transport for a backend, creating one with default settings if needed."""
+    with _transports_lock:
+        transport = _transports.get(base_url)
+        if transport is None:
+            transport = _transports[base_url] = HTTPTransport(base_url)
+        return transport
+
+
+# httpx connections belong to the event loop that opened them, so async pools are kept per loop
+_async_transports = weakref.WeakKeyDictionary()
+
+
+def get_async_transport(base_url: str) -> AsyncHTTPTransport:
+    """
+    Get the shared async transport for a backend on the running event loop.
+    It uses the pool size and timeouts configured for the backend when it is first created.
+    """
+    loop = asyncio.get_running_loop()
+    transports = _async_transports.setdefault(loop, {})
+    transport = transports.get(base_url)
+    if transport is None:
+        settings = get_transport(base_url)
+        transport = transports[base_url] = AsyncHTTPTransport(base_url, pool_size=settings.pool_size, timeout=settings.timeout)
+    return transport
@@ -1,76 +1,130 @@
+import sys
 import time
+import argparse
 from agent.tool.tool_agent import ToolAgent
 from agent.planner.planner_agent import PlannerAgent
 from agent.generic.generic_agent import GenericAgent
 from agent.interactive.interactive_agent import InteractiveAgent
 from agent.blog.blog_agent import BlogAgent
 from tool.tools import convert_currency, current_weather, country_for_city, get_current_location
+from util.batch import read_queries, completed_ids, run_batch
+from util.service import AgentService
 
-def main(test_agent=None):
-    
-    if test_agent == "blog":
+MODES = ["plan", "tool", "interactive", "blog", "generic"]
+
+# Sample queries of each mode
+QUERIES = {
+    "blog": ["Write a blog about advent of AI"],
+    "tool": ["I am traveling to Japan from India, I have 1500 of local currency, how much of Japaese currency will I be able to get?", "How is the current weather?",
+             "How is the current weather at Boca Raton, Florida?", "Tell me a joke?"],
+    "plan": ["What is a capital", "Tell me a joke?", "How is the current weather at Boca Raton, Florida?", "Write a blog about advent of AI"],
+    "interactive": ["What is the capital of the United States?", "What is the capital of Florida?", "What is the capital?"],
+    "generic": ["Tell me a sarcastic joke?"],
+}
 
-        agent = BlogAgent(model="qwen2.5:32b")
-        query_list = ["Write a blog about advent of AI"]    
-        
-        for query in query_list:
-            print(f"\nUser Query: {query}")
-            response = agent.execute(query)
-            print(f"\nResponse from the Agent: \n\n{response}")
+def build_agent(test_agent=None, model=None, **kwargs):
+    """Create the agent of a mode, extra arguments (base_url, cache...) are passed to the agent."""
+
+    if test_agent == "blog":
+        return BlogAgent(model=model, **kwargs)
 
     elif test_agent == "tool":
-        
-        agent = ToolAgent(model="qwen2.5:32b", load_default_tools=False)
+        agent = ToolAgent(model=model, load_default_tools=False, **kwargs)
         agent.add_tool(convert_currency)
         agent.add_tool(current_weather)
         agent.add_tool(country_for_city)
-        agent.add_tool(get_current_location)        
-        
-        query_list = ["I am traveling to Japan from India, I have 1500 of local currency, how much of Japaese currency will I be able to get?", "How is the current weather?",
-                      "How is the current weather at Boca Raton, Florida?","Tell me a joke?"]
-        
-        for query in query_list:
-            print(f"\nUser Query: {query}")
-            response = agent.execute(query)
-            print(f"\nResponse from the Agent: \n\n{response}")
+        agent.add_tool(get_current_location)
+        return agent
 
     elif test_agent == "plan":
-
-        agent = PlannerAgent(model="qwen2.5:32b")
-        
-        query_list = ["What is a capital", "Tell me a joke?", "How is the current weather at Boca Raton, Florida?", "Write a blog about advent of AI"]
-        
-        for query in query_list:
-            print(f"\nUser Query: {query}")
-            response = agent.execute(query)
-            print(f"\nResponse from the Agent: \n\n{response}")
+        return PlannerAgent(model=model, **kwargs)
 
     elif test_agent == "interactive":
-        agent = InteractiveAgent(model="qwen2.5:32b")
-        
-        query_list = ["What is the capital of the United States?", "What is the capital of Florida?", "What is the capital?"]
-    
-        
-        for query in query_list:
-            print(f"\nUser Query: {query}")
-            response = agent.execute(query)
-            print(f"\nResponse from the Agent: \n\n{response}")
-                
+        return InteractiveAgent(model=model, **kwargs)
+
     else:
+        return GenericAgent(model=model, **kwargs)
+
+def warm_up(agent) -> None:
+    """Pay for loading the models at startup, an unreachable backend only costs the warm-up, queries report their own errors."""
+    try:
+        agent.warm_up()
+    except Exception as e:
+        print(f"Warning: could not warm up {type(agent).__name__}, continuing without it: {str(e)}")
+
+def main(test_agent=None):
 
-        agent = GenericAgent(model="qwen2.5:32b")
-        
-        query_list = ["Tell me a sarcastic joke?"]
-        
-        for query in query_list:
-            print(f"\nUser Query: {query}")
-            response = agent.execute(query)
-            print(f"\nResponse from the Agent: \n\n{response}")
+    agent = build_agent(test_agent)
+    warm_up(agent)
+    query_list = QUERIES.get(test_agent, QUERIES["generic"])
+
+    for query in query_list:
+        print(f"\nUser Query: {query}")
+        response = agent.execute(query)
+        print(f"\nResponse from the Agent: \n\n{response}")
+
+def batch(argv):
+    """Run queries from a JSONL file or stdin through one mode's agent, writing results as they complete."""
+    parser = argparse.ArgumentParser(prog="main.py batch", description="Run many queries through an agent concurrently.")
+    parser.add_argument("mode", choices=MODES)
+    parser.add_argument("--input", default="-", help='JSONL of {"id", "query"} or one query per line, "-" for stdin')
+    parser.add_argument("--output", default="results.jsonl", help="JSONL results, one line per query in completion order")
+    parser.add_argument("--workers", type=int, default=4, help="queries in flight at once")
+    parser.add_argument("--resume", action="store_true", help="skip ids that already have a result in --output")
+    parser.add_argument("--model", help="run every agent on this model instead of the ones models.json sets")
+    parser.add_argument("--base-url", help="URL of the inference server, the agents' default when not given")
+    parser.add_argument("--adapter", default="ollama", choices=["ollama", "openai", "llama.cpp"], help="API of the inference server")
+    args = parser.parse_args(argv)
+
+    agent = build_agent(args.mode, model=args.model, adapter=args.adapter, **({"base_url": args.base_url} if args.base_url else {}))
+    warm_up(agent)
+    skip = completed_ids(args.output) if args.resume else set()
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output:
+            counts = run_batch(agent, read_queries(source), output, workers=args.workers, skip=skip)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print(f"\nBatch done in {time.perf_counter() - start:.2f} seconds: {counts['completed']} completed, "
+          f"{counts['failed']} failed, {counts['skipped']} skipped, results in {args.output}", file=sys.stderr)
+
+def serve(argv):
+    """Keep one agent per mode resident and serve queries over HTTP until interrupted."""
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Serve the agents over HTTP.")
+    parser.add_argument("--modes", nargs="+", default=[mode for mode in MODES if mode != "interactive"],
+                        choices=[mode for mode in MODES if mode != "interactive"], help="interactive asks its questions on stdin, so it can't be served")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8007)
+    parser.add_argument("--workers", type=int, default=8, help="queries in flight at once")
+    parser.add_argument("--queue-size", type=int, default=32, help="queries waiting for a worker before new ones get 503")
+    parser.add_argument("--model", help="run every agent on this model instead of the ones models.json sets")
+    parser.add_argument("--base-url", help="URL of the inference server, the agents' default when not given")
+    parser.add_argument("--adapter", default="ollama", choices=["ollama", "openai", "llama.cpp"], help="API of the inference server")
+    args = parser.parse_args(argv)
+
+    agents = {mode: build_agent(mode, model=args.model, adapter=args.adapter, **({"base_url": args.base_url} if args.base_url else {})) for mode in args.modes}
+    for agent in agents.values():
+        warm_up(agent)
+
+    server = AgentService(agents, workers=args.workers, queue_size=args.queue_size).serve(args.port, args.host)
+    print(f"Serving {', '.join(agents)} on http://{args.host}:{server.server_port} (POST /query, GET /health, GET /metrics)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
 
 if __name__ == "__main__":
-    
-    import sys
-    if len(sys.argv) > 1:
-        main(sys.argv[1]) 
+
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        batch(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve(sys.argv[2:])
+    elif len(sys.argv) > 1:
+        main(sys.argv[1])
     else:
-        main() 
+        main()
@@ -1,8 +1,31 @@
-from agent.tool.tool_registry import tool
+from agent.tool.tool_registry import tool, ToolCache
 import urllib.request
 import json
 import requests
-from typing import Dict
+from typing import Dict, Optional
+from util.metrics import metrics
+
+# Rate tables by source currency, one download serves every amount and target currency
+_rate_tables = ToolCache(ttl=3600, size=32)
+# Countries of successfully looked up cities, the fallback answer of a failed lookup is never cached
+_countries = ToolCache(ttl=86400, size=1024)
+
+
+def exchange_rates(from_currency: str) -> Optional[Dict[str, float]]:
+    """Latest exchange rates from a currency (cached for an hour), None when the API has none."""
+    key = from_currency.strip().upper()
+    found, rates = _rate_tables.get(key)
+    metrics.incr("tool_cache_hits" if found else "tool_cache_misses", tool="exchange_rates")
+    if found:
+        return rates
+
+    url = f"https://open.er-api.com/v6/latest/{key}"
+    with urllib.request.urlopen(url) as response:
+        data = json.loads(response.read())
+    if "rates" not in data:
+        return None
+    _rate_tables.set(key, data["rates"])
+    return data["rates"]
 
 @tool()
 def convert_currency(amount: float, from_currency: str, to_currency: str) -> str:
@@ -17,14 +40,11 @@ def convert_currency(amount: float, from_currency: str, to_currency: str) -> str
         - String containing the converted amount in target currency
     """
     try:
-        url = f"https://open.er-api.com/v6/latest/{from_currency.upper()}"
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read())
-            
-        if "rates" not in data:
+        rates = exchange_rates(from_currency)
+        if rates is None:
             return "Error: Could not fetch exchange rates"
             
-        rate = data["rates"].get(to_currency.upper())
+        rate = rates.get(to_currency.upper())
         if not rate:
             return f"Error: No rate found for {to_currency}"
             
@@ -35,7 +55,7 @@ def convert_currency(amount: float, from_currency: str, to_currency: str) -> str
     except Exception as e:
         return f"Error converting currency: {str(e)}"
 
-@tool()    
+@tool(cache_ttl=600)    
 def current_weather(city_name: str, country_name: str) -> Dict:
     """Get the current weather for a given city.
     
@@ -79,6 +99,12 @@ def country_for_city(city_name: str) -> str:
     Returns:
        - Name of the Country where the city is
     """
+    key = city_name.strip().casefold()
+    found, country = _countries.get(key)
+    metrics.incr("tool_cache_hits" if found else "tool_cache_misses", tool="country_for_city")
+    if found:
+        return country
+
     try:
         url = "https://countriesnow.space/api/v0.1/countries/population/cities"
         params = {
@@ -92,7 +118,9 @@ def country_for_city(city_name: str) -> str:
         if city_data.get("error") == True:
             return "USA"
         else:
-            return city_data.get("data").get("country")
+            country = city_data.get("data").get("country")
+            _countries.set(key, country)  # Only real answers are cached, not the "USA" fallback
+            return country
         
     except Exception as e:
         print( f"Error get country for city: {str(e)}")
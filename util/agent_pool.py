@@ -0,0 +1,92 @@
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Tuple
+from util.metrics import metrics
+
+
+def _config_key(class_name: str, config: Dict[str, Any]) -> Tuple:
+    # Objects like a ResponseCache are not hashable, they are matched by identity
+    def hashable(value):
+        try:
+            hash(value)
+            return value
+        except TypeError:
+            return id(value)
+    return (class_name, tuple(sorted((name, hashable(value)) for name, value in config.items())))
+
+
+class AgentPool:
+    """
+    Thread-safe pool of pre-built agents, keyed by agent class name and constructor config.
+    A borrowed agent is used by one caller at a time and handed back with release(), so its
+    LLM client, rendered system prompt and warm connections are reused by the next caller.
+    """
+    def __init__(self, registry: Dict[str, type], max_idle: int = 8):
+        self.registry = registry
+        self.max_idle = max_idle  # Idle agents kept per class and config
+        self._idle = defaultdict(list)
+        self._borrowed = {}  # id(agent) -> pool key
+        self._lock = threading.Lock()
+
+    def borrow(self, class_name: str, **config) -> Any:
+        """Get an idle agent for the class and config, building one if none is free."""
+        if class_name not in self.registry:
+            raise NameError(f"Class '{class_name}' is not defined.")
+
+        key = _config_key(class_name, config)
+        with self._lock:
+            agent = self._idle[key].pop() if self._idle[key] else None
+
+        if agent is None:
+            start = time.perf_counter()
+            agent = self.registry[class_name](**config)
+            metrics.incr("agent_pool_misses", agent=class_name)
+            metrics.observe("agent_construction_seconds", time.perf_counter() - start, agent=class_name)
+        else:
+            metrics.incr("agent_pool_hits", agent=class_name)
+
+        with self._lock:
+            self._borrowed[id(agent)] = key
+            self._update_gauges(class_name)
+        return agent
+
+    def release(self, agent: Any) -> None:
+        """Hand a borrowed agent back to the pool."""
+        with self._lock:
+            key = self._borrowed.pop(id(agent), None)
+            if key is not None and len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(agent)
+            self._update_gauges(type(agent).__name__)
+
+    @contextmanager
+    def lease(self, class_name: str, **config):
+        """Borrow an agent for the duration of a with block."""
+        agent = self.borrow(class_name, **config)
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def prewarm(self, class_name: str, count: int = 1, **config) -> None:
+        """Build agents ahead of time so the first queries don't pay for it."""
+        agents = [self.borrow(class_name, **config) for _ in range(count)]
+        for agent in agents:
+            self.release(agent)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get the number of idle and borrowed agents per class."""
+        with self._lock:
+            stats = defaultdict(lambda: {"idle": 0, "borrowed": 0})
+            for (class_name, _), agents in self._idle.items():
+                stats[class_name]["idle"] += len(agents)
+            for class_name, _ in self._borrowed.values():
+                stats[class_name]["borrowed"] += 1
+            return dict(stats)
+
+    def _update_gauges(self, class_name: str) -> None:
+        idle = sum(len(agents) for (name, _), agents in self._idle.items() if name == class_name)
+        borrowed = sum(1 for name, _ in self._borrowed.values() if name == class_name)
+        metrics.set("agent_pool_idle", idle, agent=class_name)
+        metrics.set("agent_pool_borrowed", borrowed, agent=class_name)
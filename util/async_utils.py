@@ -0,0 +1,34 @@
+import asyncio
+import threading
+from typing import Any, Coroutine
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def agent_event_loop() -> asyncio.AbstractEventLoop:
+    """Get the shared event loop used by the synchronous agent API, starting it on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="agent-event-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    Run a coroutine to completion from synchronous code.
+    Every caller shares one long lived event loop, so pooled async connections survive between calls.
+    """
+    loop = agent_event_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from the agent event loop, await the coroutine instead.")
+
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
@@ -0,0 +1,126 @@
+import json
+import time
+import asyncio
+import threading
+from typing import Dict, Iterable, Iterator, Set, TextIO
+from util.metrics import metrics
+from util.async_utils import agent_event_loop
+
+# Agents catch their own exceptions and answer with this instead of raising
+ERROR_PREFIX = "Error executing plan:"
+
+
+def is_error_response(response) -> bool:
+    return isinstance(response, str) and response.startswith(ERROR_PREFIX)
+
+
+def read_queries(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Parse batch input lazily: JSONL objects with "query" and optional "id", or plain text lines.
+    Queries without an id get their line number. Lines that can't be parsed come with an "error" instead.
+    """
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            yield _parse_line(line, number)
+        else:
+            yield {"id": str(number), "query": line}
+
+
+def _parse_line(line: str, number: int) -> Dict:
+    try:
+        item = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": str(number), "query": None, "error": f"invalid input line {number}: {str(e)}"}
+    if not isinstance(item, dict) or not isinstance(item.get("query"), str):
+        item_id = item.get("id", number) if isinstance(item, dict) else number
+        return {"id": str(item_id), "query": None, "error": f'invalid input line {number}: expected a JSON object with a "query" string'}
+    return {"id": str(item.get("id", number)), "query": item["query"]}
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids that already have a successful result in a results file, for resuming a batch."""
+    done = set()
+    try:
+        with open(path, encoding="utf-8") as results:
+            for line in results:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut short when the previous run was killed
+                if result.get("error") is None and not is_error_response(result.get("response")):
+                    done.add(str(result["id"]))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def run_batch(agent, queries: Iterable[Dict], output: TextIO, workers: int = 4, skip: Set[str] = frozenset()) -> Dict:
+    """
+    Run queries through agent.aexecute with up to `workers` in flight on the shared agent event loop.
+    Each result is written to `output` as one JSON line as soon as it completes, with its timing.
+    Queries are read only as workers free up, so the input can be a large file or a pipe.
+    Returns counts of completed, failed and skipped queries.
+    """
+    loop = agent_event_loop()
+    slots = threading.BoundedSemaphore(workers)
+    write_lock = threading.Lock()
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    agent_name = type(agent).__name__
+    in_flight = []
+
+    async def run(item):
+        started = time.time()
+        start = time.perf_counter()
+        result = {"id": item["id"], "query": item["query"]}
+        try:
+            response = await agent.aexecute(item["query"])
+            if is_error_response(response):
+                result["response"] = None
+                result["error"] = response[len(ERROR_PREFIX):].strip() or response
+            else:
+                result["response"] = response
+                result["error"] = None
+        except Exception as e:
+            result["response"] = None
+            result["error"] = str(e)
+        result["started_at"] = started
+        result["seconds"] = time.perf_counter() - start
+        metrics.observe("batch_query_seconds", result["seconds"], agent=agent_name)
+
+        with write_lock:
+            output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+            output.flush()
+            counts["failed" if result["error"] is not None else "completed"] += 1
+
+    def finished(future):
+        with write_lock:
+            in_flight.remove(future)
+            metrics.set("batch_in_flight", len(in_flight), agent=agent_name)
+        slots.release()
+
+    try:
+        for item in queries:
+            if item["id"] in skip:
+                counts["skipped"] += 1
+                continue
+            if item.get("error"):
+                # Unreadable input line, recorded as failed without running it
+                with write_lock:
+                    output.write(json.dumps(dict(item, response=None, started_at=time.time(), seconds=0.0), ensure_ascii=False) + "\n")
+                    output.flush()
+                    counts["failed"] += 1
+                continue
+            slots.acquire()  # Wait for a free worker before reading on
+            with write_lock:
+                future = asyncio.run_coroutine_threadsafe(run(item), loop)
+                in_flight.append(future)
+                metrics.set("batch_in_flight", len(in_flight), agent=agent_name)
+            future.add_done_callback(finished)
+    finally:
+        # Every worker slot free again means every query has been written, also when reading the input failed
+        for _ in range(workers):
+            slots.acquire()
+    return counts
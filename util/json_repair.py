@@ -0,0 +1,174 @@
+import re
+import json
+from typing import Any, List, Tuple
+from util.metrics import metrics
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)\s*```", re.DOTALL)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def parse_json(text: str) -> Tuple[Any, List[str]]:
+    """
+    Parse JSON produced by an LLM, salvaging the usual defects locally instead of failing:
+    markdown fences, text around the JSON value, trailing commas, Python literals,
+    raw control characters in strings and missing closing quotes/brackets.
+
+    Returns the parsed value and the names of the repairs that were needed.
+    Raises json.JSONDecodeError when the text can't be salvaged.
+    """
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError as e:
+        error = e
+
+    repairs = []
+    candidate = text.strip()
+
+    steps = [
+        ("strip_fences", _strip_fences),
+        ("extract_value", _extract_value),
+        ("fix_syntax", _fix_syntax),
+        ("close_brackets", _close_brackets),
+    ]
+    for name, step in steps:
+        repaired = step(candidate)
+        if repaired == candidate:
+            continue
+
+        candidate = repaired
+        repairs.append(name)
+        try:
+            return _parsed(json.loads(candidate), repairs)
+        except json.JSONDecodeError as e:
+            error = e
+
+    # Last resort, accept raw newlines and tabs inside strings
+    try:
+        return _parsed(json.loads(candidate, strict=False), repairs + ["control_characters"])
+    except json.JSONDecodeError:
+        metrics.incr("json_repair_failures")
+        raise error
+
+
+def _parsed(value: Any, repairs: List[str]) -> Tuple[Any, List[str]]:
+    for name in repairs:
+        metrics.incr("json_repairs", kind=name)
+    return value, repairs
+
+
+def _strip_fences(text: str) -> str:
+    """Take the content of the first ``` fenced block."""
+    match = _FENCE.search(text)
+    if match:
+        return match.group(1)
+
+    # An opened fence the model never closed
+    if text.startswith("```"):
+        return text.split("\n", 1)[1] if "\n" in text else ""
+    return text
+
+
+def _extract_value(text: str) -> str:
+    """Cut out the first balanced {...} or [...] value, dropping any commentary around it."""
+    start = min((i for i in (text.find("{"), text.find("[")) if i != -1), default=-1)
+    if start == -1:
+        return text
+
+    end, _, _ = _scan(text, start)
+    return text[start:end + 1] if end is not None else text[start:]
+
+
+def _fix_syntax(text: str) -> str:
+    """Drop trailing commas and turn Python literals into JSON, leaving string contents alone."""
+    out = []
+    i = 0
+    in_string = False
+    escaped = False
+
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            i += 1
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char == ",":
+            following = text[i + 1:].lstrip()
+            if following[:1] in ("}", "]"):
+                i += 1
+                continue
+        elif char.isalpha():
+            word = re.match(r"\w+", text[i:]).group(0)
+            out.append(_PYTHON_LITERALS.get(word, word))
+            i += len(word)
+            continue
+
+        out.append(char)
+        i += 1
+
+    return "".join(out)
+
+
+def _close_brackets(text: str) -> str:
+    """Close an unterminated string and any brackets left open by a truncated generation."""
+    start = min((i for i in (text.find("{"), text.find("[")) if i != -1), default=-1)
+    if start == -1:
+        return text
+
+    end, stack, in_string = _scan(text, start)
+    if end is not None:
+        return text
+
+    if in_string:
+        if text.endswith("\\"):
+            text = text[:-1]
+        text += '"'
+
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        text += " null"
+
+    return text + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def _scan(text: str, start: int):
+    """
+    Walk a JSON value starting at text[start] (an opening bracket).
+    Returns the index of its closing bracket (None if it never closes),
+    the brackets still open and whether the text ends inside a string.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in ("}", "]"):
+            if stack:
+                stack.pop()
+            if not stack:
+                return i, stack, False
+
+    return None, stack, in_string
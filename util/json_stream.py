@@ -0,0 +1,91 @@
+import json
+from typing import Any, Iterable, List, Tuple
+from util.json_repair import parse_json
+
+
+class JSONStreamParser:
+    """
+    Incremental parser for a JSON object generated piece by piece by an LLM.
+
+    Feed it the generated text as it arrives: every element of the top-level arrays named in `arrays`
+    (e.g. "tool_calls") is returned as soon as its closing bracket has been generated, long before the
+    whole response is complete. `done` turns True once the top-level object has closed, text after it is
+    ignored and `end` is the length of the text up to and including its closing brace.
+    Text before the object (e.g. a markdown fence) is skipped.
+    """
+    def __init__(self, arrays: Iterable[str] = ()):
+        self.arrays = set(arrays)
+        self.text = ""
+        self.done = False
+        self.end = None
+        self._stack = []  # One [bracket, current key, expecting a key] per open object or array
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._is_key = False
+        self._element_start = None
+        self._counts = {name: 0 for name in self.arrays}
+
+    def feed(self, chunk: str) -> List[Tuple[str, int, Any]]:
+        """Consume the next piece of text, returns the (array name, index, value) of every element it completed."""
+        elements = []
+        offset = len(self.text)
+        self.text += chunk
+        for index in range(offset, len(self.text)):
+            if self.done:
+                break
+            char = self.text[index]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._is_key:
+                        self._stack[-1][1] = json.loads(self.text[self._string_start:index + 1])
+                continue
+
+            if not self._stack:
+                if char == "{":
+                    self._stack.append(["{", None, True])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+                self._is_key = self._stack[-1][0] == "{" and self._stack[-1][2]
+            elif char in "{[":
+                if self._in_watched_array():
+                    self._element_start = index
+                self._stack.append([char, None, char == "{"])
+            elif char in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                    self.end = index + 1
+                elif self._in_watched_array() and self._element_start is not None:
+                    name = self._stack[0][1]
+                    element = self._element(self.text[self._element_start:index + 1])
+                    self._element_start = None
+                    if element is not None:
+                        elements.append((name, self._counts[name], element))
+                    self._counts[name] += 1
+            elif char == ":" and self._stack[-1][0] == "{":
+                self._stack[-1][2] = False
+            elif char == "," and self._stack[-1][0] == "{":
+                self._stack[-1][2] = True
+
+        return elements
+
+    def _in_watched_array(self) -> bool:
+        """True directly inside the value of a watched key of the top-level object."""
+        return len(self._stack) == 2 and self._stack[1][0] == "[" and self._stack[0][1] in self.arrays
+
+    @staticmethod
+    def _element(text: str) -> Any:
+        try:
+            return parse_json(text)[0]
+        except json.JSONDecodeError:
+            return None  # Left to the parse of the complete response
@@ -0,0 +1,128 @@
+import bisect
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Sequence, Tuple
+
+# Histogram bucket upper bounds, roughly log spaced
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+class Metrics:
+    """
+    A small thread-safe, in-process registry of counters, gauges and observed values.
+    Observed values are kept as count/sum/min/max plus a fixed-bucket histogram.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._observations = {}
+        self._buckets = {}  # name -> bucket upper bounds
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        """Increment the counter `name` for the given labels."""
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set the gauge `name` (a current size, a queue length...) for the given labels."""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels) -> None:
+        """Record one observed value (a latency, a size...) for `name`, the first observation of a name fixes its buckets."""
+        key = _key(name, labels)
+        with self._lock:
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+            stats = self._observations.get(key)
+            if stats is None:
+                stats = self._observations[key] = {"count": 0, "sum": 0.0, "min": value, "max": value, "buckets": [0] * (len(bounds) + 1)}
+            stats["count"] += 1
+            stats["sum"] += value
+            stats["min"] = min(stats["min"], value)
+            stats["max"] = max(stats["max"], value)
+            stats["buckets"][bisect.bisect_left(bounds, value)] += 1
+
+    def value(self, name: str, **labels) -> float:
+        """Get the current value of a counter."""
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> Dict:
+        """Get a copy of every counter, gauge and observation, keyed by name and labels."""
+        with self._lock:
+            return {
+                "counters": {self._format(key): value for key, value in self._counters.items()},
+                "gauges": {self._format(key): value for key, value in self._gauges.items()},
+                "observations": {self._format(key): dict(stats, buckets=list(stats["buckets"])) for key, stats in self._observations.items()},
+            }
+
+    def prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({key[0] for key in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines += [f"{self._format(key)} {value}" for key, value in values.items() if key[0] == name]
+
+            for name in sorted({key[0] for key in self._observations}):
+                bounds = self._buckets[name]
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), stats in self._observations.items():
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(bounds) + ["+Inf"], stats["buckets"]):
+                        cumulative += count
+                        lines.append(f"{self._format((name + '_bucket', labels + (('le', str(bound)),)))} {cumulative}")
+                    lines.append(f"{self._format((name + '_sum', labels))} {stats['sum']}")
+                    lines.append(f"{self._format((name + '_count', labels))} {stats['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._observations.clear()
+
+    @staticmethod
+    def _format(key: Tuple) -> str:
+        name, labels = key
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# Process wide registry used by the clients, agents and tools
+metrics = Metrics()
+
+
+def serve_metrics(port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the registry at http://host:port/metrics for Prometheus to scrape, from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
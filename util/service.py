@@ -0,0 +1,184 @@
+import json
+import time
+import queue
+import asyncio
+import inspect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from util.metrics import metrics
+from util.async_utils import agent_event_loop
+
+_DONE = object()
+
+
+class AgentService:
+    """
+    Serve resident agents over HTTP, so a query only pays for its LLM and tool work.
+
+    POST /query  {"mode": "...", "query": "...", "stream": false}
+                 Returns {"mode", "response", "seconds"}. With "stream": true the answer is sent as
+                 server-sent events: "token" events with partial LLM output (for agents that accept
+                 on_token), then one "done" event with the same JSON as the non streaming answer.
+    GET  /health Modes served, queries in flight and queued.
+    GET  /metrics The metrics registry in Prometheus text format.
+
+    At most `workers` queries run at once on the shared agent event loop, up to `queue_size` more wait
+    for a worker. Beyond that requests are rejected with 503, so overload shows up at the client
+    instead of as unbounded latency.
+    """
+    def __init__(self, agents: Dict[str, object], workers: int = 8, queue_size: int = 32):
+        self.agents = agents
+        self.workers = workers
+        self.queue_size = queue_size
+        self._admitted = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._slots = None  # asyncio.Semaphore, created on the agent event loop
+
+    def health(self) -> Dict:
+        with self._lock:
+            return {"status": "ok", "modes": sorted(self.agents), "in_flight": self._in_flight, "queued": self._queued,
+                    "workers": self.workers, "queue_size": self.queue_size}
+
+    def submit(self, mode: str, query: str, on_token=None):
+        """
+        Queue a query for the mode's agent and return a concurrent.futures.Future of its result dict.
+        Returns None when the queue is full.
+        """
+        if not self._admitted.acquire(blocking=False):
+            metrics.incr("service_rejected", mode=mode)
+            return None
+        self._change(queued=1)
+        future = asyncio.run_coroutine_threadsafe(self._run(mode, query, on_token), agent_event_loop())
+        future.add_done_callback(lambda _: self._admitted.release())
+        return future
+
+    async def _run(self, mode: str, query: str, on_token):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        queued_at = time.perf_counter()
+        async with self._slots:
+            self._change(queued=-1, in_flight=1)
+            metrics.observe("service_queue_seconds", time.perf_counter() - queued_at, mode=mode)
+            start = time.perf_counter()
+            try:
+                agent = self.agents[mode]
+                if on_token is not None and "on_token" in inspect.signature(agent.aexecute).parameters:
+                    response = await agent.aexecute(query, on_token=on_token)
+                else:
+                    response = await agent.aexecute(query)
+            finally:
+                self._change(in_flight=-1)
+            seconds = time.perf_counter() - start
+            metrics.observe("service_request_seconds", seconds, mode=mode)
+            return {"mode": mode, "response": response, "seconds": seconds}
+
+    def _change(self, queued: int = 0, in_flight: int = 0) -> None:
+        with self._lock:
+            self._queued += queued
+            self._in_flight += in_flight
+            metrics.set("service_queued", self._queued)
+            metrics.set("service_in_flight", self._in_flight)
+
+    def serve(self, port: int = 8007, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Start serving from a daemon thread, returns the server (call shutdown() to stop it)."""
+        server = ThreadingHTTPServer((host, port), _handler(self))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="agent-service", daemon=True).start()
+        return server
+
+
+def _handler(service: AgentService):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                self._send(200, json.dumps(service.health()), "application/json")
+            elif path == "/metrics":
+                self._send(200, metrics.prometheus(), "text/plain; version=0.0.4")
+            else:
+                self._send(404, json.dumps({"error": "not found"}), "application/json")
+
+        def do_POST(self):
+            if self.path.split("?")[0] != "/query":
+                self._send(404, json.dumps({"error": "not found"}), "application/json")
+                return
+
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                mode, query = request.get("mode", "generic"), request["query"]
+            except (ValueError, KeyError, TypeError):
+                self._send(400, json.dumps({"error": 'expected a JSON body with "query" and optional "mode"'}), "application/json")
+                return
+            if mode not in service.agents:
+                self._send(400, json.dumps({"error": f"unknown mode {mode}, expected one of {sorted(service.agents)}"}), "application/json")
+                return
+
+            if request.get("stream"):
+                self._stream(mode, query)
+                return
+
+            future = service.submit(mode, query)
+            if future is None:
+                self._busy()
+                return
+            try:
+                self._send(200, json.dumps(future.result(), default=str), "application/json")
+            except Exception as e:
+                self._send(500, json.dumps({"error": str(e)}), "application/json")
+
+        def _stream(self, mode: str, query: str):
+            tokens = queue.Queue()
+            future = service.submit(mode, query, on_token=tokens.put)
+            if future is None:
+                self._busy()
+                return
+            future.add_done_callback(lambda _: tokens.put(_DONE))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while (token := tokens.get()) is not _DONE:
+                    self._event("token", token)
+                try:
+                    self._event("done", json.dumps(future.result(), default=str))
+                except Exception as e:
+                    self._event("error", json.dumps({"error": str(e)}))
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client went away, the query still finishes on the event loop
+
+        def _event(self, event: str, data: str):
+            lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+            self.wfile.write(f"event: {event}\n{lines}\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def _busy(self):
+            self.send_response(503)
+            body = json.dumps({"error": "queue full, retry later"}).encode("utf-8")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send(self, status: int, body: str, content_type: str):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
@@ -1,20 +1,32 @@
-import time
+import inspect
 from functools import wraps
+from util.metrics import metrics
+from util.tracing import tracer
 
 def time_execution(method):
     """
-    A decorator to measure and print the execution time of a function in a class.
+    A decorator to trace a function (or coroutine) in a class as an "agent" span named Class.method.
+    LLM and tool calls made inside become child spans, times are also recorded as `stage_seconds` metrics.
     """
+    if inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            with tracer.span(_stage(method, args), kind="agent") as span:
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    metrics.observe("stage_seconds", span.duration, stage=span.name)
+        return async_wrapper
+
     @wraps(method)
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = method(*args, **kwargs)
-        end_time = time.time()
-        class_name = args[0].__class__.__name__ if args else None
-        if class_name:
-            print(f"Execution time for {class_name}.{method.__name__}: {end_time - start_time:.6f} seconds")
-        else:
-            print(f"Execution time for {method.__name__}: {end_time - start_time:.6f} seconds")
-        
-        return result
-    return wrapper
\ No newline at end of file
+        with tracer.span(_stage(method, args), kind="agent") as span:
+            try:
+                return method(*args, **kwargs)
+            finally:
+                metrics.observe("stage_seconds", span.duration, stage=span.name)
+    return wrapper
+
+def _stage(method, args):
+    class_name = args[0].__class__.__name__ if args else None
+    return f"{class_name}.{method.__name__}" if class_name else method.__name__
@@ -0,0 +1,128 @@
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """One timed step (an agent execute, an LLM call, a tool call), nested under the span that was current when it started."""
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.perf_counter)  # Monotonic clock, only differences are meaningful
+    timestamp: float = field(default_factory=time.time)  # Wall clock start, for lining spans up with logs
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "timestamp": self.timestamp,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class ConsoleExporter:
+    """Prints the execution time of agent spans, like time_execution always did."""
+    def __init__(self, kinds=("agent",)):
+        self.kinds = kinds
+
+    def export(self, span: Span) -> None:
+        if span.kind in self.kinds:
+            print(f"Execution time for {span.name}: {span.duration:.6f} seconds")
+
+
+class JSONLExporter:
+    """Appends every finished span to a JSONL file."""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Creates nested spans and hands each finished span to the exporters.
+    The current span follows the code through awaits and asyncio tasks (it is a context variable),
+    so spans started in a sub agent, an LLM call or a tool call get the right parent.
+    """
+    def __init__(self, exporters: List = None):
+        self.exporters = list(exporters) if exporters is not None else [ConsoleExporter()]
+
+    def add_exporter(self, exporter) -> None:
+        self.exporters = self.exporters + [exporter]
+
+    def set_exporters(self, exporters: List) -> None:
+        self.exporters = list(exporters)
+
+    def start(self, name: str, kind: str = "internal", **attributes) -> Span:
+        """Start a span under the current one without making it current, end it with finish()."""
+        parent = _current_span.get()
+        return Span(
+            name=name,
+            kind=kind,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+
+    def finish(self, span: Span) -> None:
+        span.end = time.perf_counter()
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Failed to export span {span.name}: {str(e)}")
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """Time the with block as a span, spans started inside it become its children."""
+        span = self.start(name, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+# Process wide tracer, add a JSONLExporter (or replace the console one) to collect traces
+tracer = Tracer()
@@ -4,20 +4,42 @@ from agent.tool.tool_agent import ToolAgent
 from agent.interactive.interactive_agent import InteractiveAgent
 
 
+from util.agent_pool import AgentPool
+
+# Agents the planner can delegate to, by class name
+agent_registry = {cls.__name__: cls for cls in (BlogAgent, GenericAgent, ToolAgent, InteractiveAgent)}
+
+# Delegated agents are reused across queries instead of being rebuilt for every call
+agent_pool = AgentPool(agent_registry)
+
+
 # Generic function to call a method dynamically
-def invoke_agent(class_name, method_name, *args, **kwargs):
-    # Check if the class exists
-    if class_name in globals():
-        cls = globals()[class_name]  # Get the class from global scope
-        obj = cls()  # Instantiate the class
+# `agent_config` holds the constructor arguments (base_url, model...) of the agent to borrow
+def invoke_agent(class_name, method_name, *args, agent_config=None, **kwargs):
+    obj = agent_pool.borrow(class_name, **(agent_config or {}))  # Borrow an agent built with this config
+    try:
         if hasattr(obj, method_name):  # Check if the method exists
             method = getattr(obj, method_name)  # Get the method
-            print(f"Invoking agent: '{cls.__name__}'")
+            print(f"Invoking agent: '{class_name}'")
             return method(*args, **kwargs)  # Call the method
         else:
             raise AttributeError(f"'{class_name}' object has no method '{method_name}'")
-    else:
-        raise NameError(f"Class '{class_name}' is not defined.")
+    finally:
+        agent_pool.release(obj)
+
+
+# Async version of invoke_agent, awaits the method (e.g. 'aexecute') on the borrowed agent
+async def ainvoke_agent(class_name, method_name, *args, agent_config=None, **kwargs):
+    obj = agent_pool.borrow(class_name, **(agent_config or {}))  # Borrow an agent built with this config
+    try:
+        if hasattr(obj, method_name):  # Check if the method exists
+            method = getattr(obj, method_name)  # Get the method
+            print(f"Invoking agent: '{class_name}'")
+            return await method(*args, **kwargs)  # Call the method
+        else:
+            raise AttributeError(f"'{class_name}' object has no method '{method_name}'")
+    finally:
+        agent_pool.release(obj)
 
 
 # def invoke_agent(class_name, method_name, init_args=None, init_kwargs=None, *args, **kwargs):